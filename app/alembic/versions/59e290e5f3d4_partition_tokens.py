@@ -0,0 +1,96 @@
+"""Partition tokens by created_at
+
+Revision ID: 59e290e5f3d4
+Revises: e5d780aa95f4
+Create Date: 2026-10-18 10:20:13.512377
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "59e290e5f3d4"
+down_revision: Union[str, None] = "e5d780aa95f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS_AHEAD = 7
+
+
+def token_columns(created_at: sa.Column) -> list:
+    return [
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("access_jti", sa.UUID(), nullable=True),
+        sa.Column("refresh_jti", sa.UUID(), nullable=True),
+        sa.Column("access_exp", sa.Integer(), nullable=True),
+        sa.Column("refresh_exp", sa.Integer(), nullable=True),
+        created_at,
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+    ]
+
+
+def upgrade() -> None:
+    # Existing rows are not copied: the old table becomes the partition of
+    # everything created before now and is dropped once its tokens expire.
+    now = datetime.now().replace(microsecond=0)
+    op.rename_table("tokens", "tokens_legacy")
+    op.execute(
+        "ALTER TABLE tokens_legacy RENAME CONSTRAINT tokens_pkey TO tokens_legacy_pkey"
+    )
+    op.execute(
+        sa.text(
+            "UPDATE tokens_legacy SET created_at = :before WHERE created_at IS NULL"
+        ).bindparams(before=now - timedelta(seconds=1))
+    )
+    op.alter_column("tokens_legacy", "created_at", nullable=False)
+
+    op.create_table(
+        "tokens",
+        *token_columns(
+            sa.Column(
+                "created_at",
+                sa.DateTime(),
+                server_default=sa.text("now()"),
+                nullable=False,
+            )
+        ),
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    op.execute(
+        f"ALTER TABLE tokens ATTACH PARTITION tokens_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{now}')"
+    )
+    op.execute("CREATE TABLE tokens_default PARTITION OF tokens DEFAULT")
+
+    start = now
+    for offset in range(PARTITIONS_AHEAD + 1):
+        day = now.date() + timedelta(days=offset + 1)
+        op.execute(
+            f"CREATE TABLE tokens_{start:%Y%m%d} PARTITION OF tokens "
+            f"FOR VALUES FROM ('{start}') TO ('{day}')"
+        )
+        start = day
+
+
+def downgrade() -> None:
+    op.rename_table("tokens", "tokens_partitioned")
+    op.execute(
+        "ALTER TABLE tokens_partitioned "
+        "RENAME CONSTRAINT tokens_pkey TO tokens_partitioned_pkey"
+    )
+    op.create_table(
+        "tokens",
+        *token_columns(sa.Column("created_at", sa.DateTime(), nullable=True)),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(
+        "INSERT INTO tokens "
+        "SELECT user_id, access_jti, refresh_jti, access_exp, refresh_exp, "
+        "created_at, id FROM tokens_partitioned"
+    )
+    op.drop_table("tokens_partitioned")
@@ -0,0 +1,36 @@
+"""Server side ids and timestamps
+
+Revision ID: 8b1c4d2e7f90
+Revises: 59e290e5f3d4
+Create Date: 2026-10-18 16:42:07.105394
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b1c4d2e7f90"
+down_revision: Union[str, None] = "59e290e5f3d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMESTAMPED = ("users", "roles", "user_roles", "sessions")
+
+
+def upgrade() -> None:
+    # The tokens default reaches its partitions too.
+    for table in (*TIMESTAMPED, "tokens"):
+        op.alter_column(table, "id", server_default=sa.text("gen_random_uuid()"))
+    for table in TIMESTAMPED:
+        op.alter_column(table, "created_at", server_default=sa.text("now()"))
+        op.alter_column(table, "modified_at", server_default=sa.text("now()"))
+
+
+def downgrade() -> None:
+    for table in TIMESTAMPED:
+        op.alter_column(table, "modified_at", server_default=None)
+        op.alter_column(table, "created_at", server_default=None)
+    for table in (*TIMESTAMPED, "tokens"):
+        op.alter_column(table, "id", server_default=None)
@@ -0,0 +1,40 @@
+"""Role bits
+
+Revision ID: e5d780aa95f4
+Revises: c1fa79487c16
+Create Date: 2024-10-14 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e5d780aa95f4"
+down_revision: Union[str, None] = "c1fa79487c16"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        sa.schema.CreateSequence(sa.Sequence("roles_bit_seq", start=0, minvalue=0))
+    )
+    # Existing roles get their bits from the sequence default.
+    op.add_column(
+        "roles",
+        sa.Column(
+            "bit",
+            sa.Integer(),
+            server_default=sa.text("nextval('roles_bit_seq')"),
+            nullable=False,
+        ),
+    )
+    op.create_unique_constraint("roles_bit_key", "roles", ["bit"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("roles_bit_key", "roles", type_="unique")
+    op.drop_column("roles", "bit")
+    op.execute(sa.schema.DropSequence(sa.Sequence("roles_bit_seq")))
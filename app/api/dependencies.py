@@ -0,0 +1,58 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from schemas.auth import Payload
+from services.auth import AuthService, get_auth_service
+
+get_token = HTTPBearer(auto_error=False)
+
+
+async def get_claims(
+    request: Request,
+    access_token: Optional[HTTPAuthorizationCredentials] = Depends(get_token),
+    auth_service: AuthService = Depends(get_auth_service),
+) -> Optional[Payload]:
+    """
+    Claims of the bearer token, verified once per request and kept on
+    request.state.claims for everything else that handles the request.
+    None if there is no token or it is invalid or revoked.
+    """
+    if not hasattr(request.state, "claims"):
+        request.state.claims = None
+        if access_token:
+            request.state.claims = await auth_service.get_claims(
+                access_token.credentials
+            )
+    return request.state.claims
+
+
+async def require_claims(
+    access_token: Optional[HTTPAuthorizationCredentials] = Depends(get_token),
+    claims: Optional[Payload] = Depends(get_claims),
+) -> Payload:
+    if not access_token:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if not claims:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
+        )
+    return claims
+
+
+def require_roles(allow_roles: list[str]):
+    """
+    Dependency that lets through only tokens with one of allow_roles.
+    """
+
+    async def dependency(
+        claims: Payload = Depends(require_claims),
+        auth_service: AuthService = Depends(get_auth_service),
+    ) -> Payload:
+        if not await auth_service.allows(claims, allow_roles):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
+            )
+        return claims
+
+    return dependency
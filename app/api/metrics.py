@@ -0,0 +1,13 @@
+from core.metrics import render_metrics
+from fastapi import APIRouter, Response
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False, response_class=Response)
+async def metrics() -> Response:
+    """
+    Prometheus metrics of all workers.
+    """
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
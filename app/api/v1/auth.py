@@ -1,20 +1,30 @@
+import math
+import time
 from typing import Annotated, Literal, Optional, Union
 from uuid import UUID
 
+from api.dependencies import get_claims, get_token, require_claims
+from core.config import auth_settings
 from core.logger import logger
-from fastapi import APIRouter, Body, Depends, Request, Response, status
+from core.metrics import login_attempts_throttled
+from db.throttle import login_throttle
+from fastapi import APIRouter, Body, Depends, Header, Request, Response, status
 from fastapi.exceptions import HTTPException
-from fastapi.security import HTTPBearer
-from schemas.auth import TwoTokens, UserLoginModel
+from fastapi.security import HTTPAuthorizationCredentials
+from schemas.auth import (
+    Payload,
+    TokenCheckBatch,
+    TokenVerdict,
+    TwoTokens,
+    UserLoginModel,
+)
 from schemas.base import HTTPExceptionResponse, HTTPValidationError
-from schemas.session import SessionCreate, SessionUpdate
+from schemas.session import SessionUpdate
 from schemas.user import UserCreate, UserResponse
 from services.auth import AuthService, get_auth_service
 from services.session import SessionService, get_session_service
 from services.user import UserService, get_user_service
 
-get_token = HTTPBearer(auto_error=False)
-
 router = APIRouter()
 
 
@@ -35,19 +45,10 @@ async def signup(
     Register a new user.
     """
     logger.info(f"Requested /signup with {user_create}")
-    if await user_service.get_user_by_email(user_create.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The email is already in use",
-        )
-    if await user_service.get_user_by_username(user_create.username):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The username is already in use",
-        )
-
-    created_new_user = await user_service.create_user(user_create)
-    return created_new_user
+    try:
+        return await user_service.create_user(user_create)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.post(
@@ -57,6 +58,7 @@ async def signup(
     responses={
         status.HTTP_401_UNAUTHORIZED: {"model": HTTPExceptionResponse},
         status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": HTTPValidationError},
+        status.HTTP_429_TOO_MANY_REQUESTS: {"model": HTTPExceptionResponse},
     },
     tags=["Authorization"],
 )
@@ -65,53 +67,34 @@ async def login(
     request: Request,
     response: Response,
     auth_service: AuthService = Depends(get_auth_service),
-    session_service: SessionService = Depends(get_session_service),
 ) -> Union[TwoTokens, HTTPExceptionResponse, HTTPValidationError]:
     """
     Login a user to get a tokens pair.
     """
     logger.info(f"Requested /register with {form_data}")
-    user = await auth_service.get_user_by_email(form_data.email)
-    if not user:
+    # nginx puts the client address in X-Real-IP.
+    client_ip = request.headers.get("x-real-ip") or request.client.host
+    verdict = await login_throttle.hit(form_data.email, client_ip)
+    if verdict.retry_after:
+        logger.info(f"Login for {form_data.email} from {client_ip} is throttled")
+        login_attempts_throttled.labels(verdict.scope).inc()
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad username or password"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(verdict.retry_after))},
         )
 
     logger.info(f"user agent is {request.headers.get('user-agent')}")
     user_agent = request.headers.get("user-agent", "Unknown")
 
-    tokens = await auth_service.login(form_data.email, form_data.password)
+    tokens = await auth_service.login(form_data.email, form_data.password, user_agent)
 
     if not tokens:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad username or password"
         )
 
-    session = await session_service.get_session_by_user_and_agent(
-        user_id=user.id, user_agent=user_agent
-    )
-
-    if session:
-        # Update existing session with login action
-        logger.info(
-            f"Updating existing session for user {user.id} and agent {user_agent}"
-        )
-        await session_service.update_session(
-            session_id=session.id,
-            session_data=SessionUpdate(
-                user_id=user.id,
-                user_agent=user_agent,
-                user_action="login",
-            ),
-        )
-    else:
-        session_data = SessionCreate(
-            user_id=user.id,
-            user_agent=user_agent,
-            user_action="login",
-        )
-        await session_service.create_session(session_data)
-
+    await login_throttle.reset(form_data.email)
     return tokens
 
 
@@ -125,7 +108,8 @@ async def login(
 )
 async def logout(
     request: Request,
-    access_token: str = Depends(get_token),
+    access_token: Optional[HTTPAuthorizationCredentials] = Depends(get_token),
+    claims: Optional[Payload] = Depends(get_claims),
     auth_service: AuthService = Depends(get_auth_service),
     session_service: SessionService = Depends(get_session_service),
 ) -> Optional[HTTPExceptionResponse]:
@@ -134,18 +118,17 @@ async def logout(
     This only logs out if the user-agent matches the session's recorded user-agent.
     """
     if not access_token:
-        raise HTTPException(status_code=status.status.HTTP_422_UNPROCESSABLE_ENTITY)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
     user_agent = request.headers.get("user-agent", "Unknown")
-    user = await auth_service.check_access(creds=access_token.credentials)
 
-    if not user:
+    if not claims:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session not found for matching user-agent",
         )
 
-    user_uuid = UUID(user.get("user_id"))
+    user_uuid = UUID(claims.user["user_id"])
     session = await session_service.get_session_by_user_and_agent(
         user_id=user_uuid, user_agent=user_agent
     )
@@ -160,10 +143,32 @@ async def logout(
             ),
         )
 
-        await auth_service.logout(access_token.credentials)
+        await auth_service.logout(claims)
         return status.HTTP_200_OK
 
 
+@router.post(
+    "/logout_all",
+    response_model=None,
+    status_code=status.HTTP_200_OK,
+    summary="Log out from all devices",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": HTTPExceptionResponse},
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": HTTPValidationError},
+    },
+    tags=["Authorization"],
+)
+async def logout_all(
+    claims: Payload = Depends(require_claims),
+    auth_service: AuthService = Depends(get_auth_service),
+) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
+    """
+    Revoke every access and refresh token of the user, including this one.
+    """
+    await auth_service.logout_everywhere(claims.user["user_id"])
+    return status.HTTP_200_OK
+
+
 @router.post(
     "/refresh",
     response_model=TwoTokens,
@@ -178,7 +183,6 @@ async def refresh_tokens(
     refresh_token: Annotated[str, Body(embed=True)],
     request: Request,
     auth_service: AuthService = Depends(get_auth_service),
-    session_service: SessionService = Depends(get_session_service),
 ) -> Union[TwoTokens, HTTPExceptionResponse, HTTPValidationError]:
     """
     Refresh tokens and update session with a refresh action.
@@ -186,39 +190,16 @@ async def refresh_tokens(
     logger.info(f"Refresh token with token {refresh_token}")
 
     if not refresh_token:
-        raise HTTPException(status_code=status.status.HTTP_422_UNPROCESSABLE_ENTITY)
-    logger.info(f"token to refresh {refresh_token}")
-
-    decoded_token = await auth_service.decode_jwt(refresh_token)
-
-    if decoded_token and decoded_token.get("refresh"):
-        if await auth_service.check_access(refresh_token):
-            user = await auth_service.get_user_by_email(decoded_token["user"]["email"])
-            logger.info(f"get user to refresh: {user}")
-
-            if user:
-                tokens = await auth_service.refresh_tokens(refresh_token)
-
-                user_uuid = UUID(decoded_token["user"]["user_id"])
-                user_agent = request.headers.get("user-agent", "Unknown")
-                session = await session_service.get_session_by_user_and_agent(
-                    user_id=user_uuid, user_agent=user_agent
-                )
-                if session:
-                    await session_service.update_session(
-                        session.id,
-                        SessionUpdate(
-                            user_id=user_uuid,
-                            user_agent=user_agent,
-                            user_action="refresh",
-                        ),
-                    )
-
-                return tokens
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Session not found for matching user-agent",
-    )
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    user_agent = request.headers.get("user-agent", "Unknown")
+    tokens = await auth_service.rotate_tokens(refresh_token, user_agent)
+    if not tokens:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session not found for matching user-agent",
+        )
+    return tokens
 
 
 @router.get(
@@ -234,7 +215,8 @@ async def refresh_tokens(
 )
 async def check_access(
     request: Request,
-    access_token: str = Depends(get_token),
+    access_token: Optional[HTTPAuthorizationCredentials] = Depends(get_token),
+    claims: Optional[Payload] = Depends(get_claims),
     allow_roles: Literal["admin", "user"] = None,
     auth_service: AuthService = Depends(get_auth_service),
 ) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
@@ -245,15 +227,95 @@ async def check_access(
         logger.info(f"Check access for {access_token.credentials}")
 
         if allow_roles:
-            if await auth_service.check_access_with_roles(
-                creds=access_token.credentials, allow_roles=allow_roles
-            ):
+            if claims and await auth_service.allows(claims, (allow_roles,)):
                 return status.HTTP_200_OK
         if not allow_roles:
-            if await auth_service.check_access(creds=access_token.credentials):
+            if claims:
                 return status.HTTP_200_OK
 
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
     raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+@router.post(
+    "/check_access/batch",
+    response_model=list[TokenVerdict],
+    summary="Check access for several tokens",
+    responses={
+        "422": {"model": HTTPValidationError},
+    },
+    tags=["Authorization"],
+)
+async def check_access_batch(
+    body: TokenCheckBatch,
+    auth_service: AuthService = Depends(get_auth_service),
+) -> Union[list[TokenVerdict], HTTPValidationError]:
+    """
+    Check access for several tokens at once, each against its own roles.
+    """
+    if len(body.tokens) > auth_settings.check_access_batch_max:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"No more than {auth_settings.check_access_batch_max} tokens allowed",
+        )
+
+    return await auth_service.check_access_batch(body.tokens)
+
+
+NO_STORE = {"Cache-Control": "no-store"}
+# X-Allow-Roles of a location open to any authenticated user.
+ANY_ROLE = "*"
+
+
+@router.get(
+    "/authorize",
+    summary="Authorize nginx subrequest",
+    response_class=Response,
+    responses={
+        "401": {"description": "Token is missing, invalid or revoked"},
+        "403": {"description": "Token has none of the allowed roles"},
+    },
+    tags=["Authorization"],
+)
+async def authorize(
+    access_token: Optional[HTTPAuthorizationCredentials] = Depends(get_token),
+    claims: Optional[Payload] = Depends(get_claims),
+    allow_roles: Optional[str] = Header(None, alias="X-Allow-Roles"),
+    auth_service: AuthService = Depends(get_auth_service),
+) -> Response:
+    """
+    Answer nginx auth_request with a bare status code. The X-Allow-Roles
+    header is a comma separated list, or * for any authenticated user.
+    A successful answer carries the user
+    in headers and may be cached until the token expires, but no longer
+    than revocations are allowed to lag.
+    """
+    roles = [
+        role for role in (allow_roles or "").split(",") if role and role != ANY_ROLE
+    ]
+    if not access_token:
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED, headers=NO_STORE)
+
+    if not claims:
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED, headers=NO_STORE)
+    if roles and not await auth_service.allows(claims, roles):
+        return Response(status_code=status.HTTP_403_FORBIDDEN, headers=NO_STORE)
+
+    max_age = math.floor(
+        min(
+            auth_settings.auth_request_cache_seconds,
+            auth_settings.revocation_max_staleness_seconds,
+        )
+    )
+    if claims.exp:
+        max_age = max(min(max_age, claims.exp - int(time.time())), 0)
+    return Response(
+        status_code=status.HTTP_200_OK,
+        headers={
+            "X-User-Id": claims.user.get("user_id", ""),
+            "X-User-Roles": ",".join(auth_service.role_names(claims.user)),
+            "Cache-Control": f"max-age={max_age}",
+        },
+    )
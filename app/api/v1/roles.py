@@ -1,22 +1,19 @@
 from typing import List, Optional, Union
 from uuid import UUID
 
-from core.logger import logger
+from api.dependencies import require_roles
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer
+from schemas.auth import Payload
 from schemas.base import HTTPExceptionResponse, HTTPValidationError
 from schemas.role import RoleBase, RoleResponse
-from services.auth import AuthService, get_auth_service
 from services.role import RoleService, get_role_service
 
-get_token = HTTPBearer(auto_error=False)
-
-
 router = APIRouter()
 
 roles_with_allowed = [
     "admin",
 ]
+require_admin = require_roles(roles_with_allowed)
 
 
 @router.get(
@@ -30,23 +27,10 @@ roles_with_allowed = [
     tags=["Manage roles"],
 )
 async def list_roles(
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_admin),
     role_service: RoleService = Depends(get_role_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[List[RoleResponse], HTTPExceptionResponse]:
 
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    logger.info(f"Check access for {access_token.credentials}")
-
-    if not await auth_service.check_access_with_roles(
-        access_token.credentials, roles_with_allowed
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
-
     return await role_service.list_roles()
 
 
@@ -64,22 +48,12 @@ async def list_roles(
 )
 async def create_role(
     body: RoleBase,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_admin),
     role_service: RoleService = Depends(get_role_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[RoleResponse, HTTPExceptionResponse, HTTPValidationError]:
     """
     Create role
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    if not await auth_service.check_access_with_roles(
-        access_token.credentials, roles_with_allowed
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
     new_role = await role_service.create_role(body)
     if new_role:
         return new_role
@@ -99,26 +73,13 @@ async def create_role(
 )
 async def delete_role(
     role_id: UUID,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_admin),
     role_service: RoleService = Depends(get_role_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
     """
     Delete role
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    logger.info(f"Check access for {access_token.credentials}")
-
-    if not await auth_service.check_access_with_roles(
-        access_token.credentials, roles_with_allowed
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
-    if await role_service.get_role_by_id(role_id):
-        role_service.delete_role(role_id)
+    if await role_service.delete_role(role_id):
         return status.HTTP_200_OK
 
 
@@ -137,24 +98,12 @@ async def delete_role(
 async def change_role(
     role_id: UUID,
     body: RoleBase,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_admin),
     role_service: RoleService = Depends(get_role_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[RoleResponse, HTTPExceptionResponse, HTTPValidationError]:
     """
     Change role
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    logger.info(f"Check access for {access_token.credentials}")
-
-    if not await auth_service.check_access_with_roles(
-        access_token.credentials, roles_with_allowed
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
     if not await role_service.get_role_by_id(role_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
@@ -1,19 +1,17 @@
 from typing import List, Optional, Union
 from uuid import UUID
 
+from api.dependencies import require_claims
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.security import HTTPBearer
 from pydantic import conint
+from schemas.auth import Payload
 from schemas.base import HTTPExceptionResponse, HTTPValidationError
 from schemas.role import RoleBaseUUID  # noqa
 from schemas.session import SessionResponse
 from schemas.user import UserPatch, UserResponse
-from services.auth import AuthService, get_auth_service
 from services.session import SessionService, get_session_service
 from services.user import UserService, get_user_service
 
-get_token = HTTPBearer(auto_error=False)
-
 router = APIRouter()
 
 
@@ -30,23 +28,12 @@ router = APIRouter()
 async def delete_user_session(
     request: Request,
     session_id: UUID,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     session_service: SessionService = Depends(get_session_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
     """
     Delete user session by session ID.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
-
     session = await session_service.get_session(session_id)
     if session:
         if await session_service.delete_session(session_id):
@@ -74,22 +61,13 @@ async def get_user_sessions(
     request: Request,
     page_size: PageSizeType = 50,
     page_number: PageSizeType = 1,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     session_service: SessionService = Depends(get_session_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[List[SessionResponse], HTTPExceptionResponse]:
     """
     Retrieve user's session history with optional pagination and activity filter.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
-        )
-    user_uuid = UUID(user.get("user_id"))
+    user_uuid = UUID(claims.user["user_id"])
     sessions = await session_service.get_sessions_by_user(user_uuid)
     if not sessions:
         return []
@@ -117,21 +95,12 @@ async def add_role_to_user(
     request: Request,
     user_id: UUID,
     role_id: UUID,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     user_service: UserService = Depends(get_user_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
     """
     Add a role to a user.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated"
-        )
     try:
         msg = await user_service.add_role_to_user(user_id, role_id)
     except ValueError as e:
@@ -155,21 +124,12 @@ async def take_away_role_from_user(
     request: Request,
     user_id: UUID,
     role_id: UUID,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     user_service: UserService = Depends(get_user_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Optional[Union[HTTPExceptionResponse, HTTPValidationError]]:
     """
     Remove a role from a user.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated"
-        )
     try:
         msg = await user_service.remove_role_from_user(user_id, role_id)
     except ValueError as e:
@@ -190,22 +150,13 @@ async def take_away_role_from_user(
 )
 async def get_user_info(
     request: Request,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     user_service: UserService = Depends(get_user_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[UserResponse, HTTPExceptionResponse]:
     """
     Retrieve current user's information.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated"
-        )
-    user_uuid = UUID(user.get("user_id"))
+    user_uuid = UUID(claims.user["user_id"])
     user_info = await user_service.get_current_user(user_uuid)
     if not user_info:
         raise HTTPException(
@@ -228,23 +179,14 @@ async def get_user_info(
 async def patch_current_user(
     request: Request,
     body: UserPatch,
-    access_token: str = Depends(get_token),
+    claims: Payload = Depends(require_claims),
     user_service: UserService = Depends(get_user_service),
-    auth_service: AuthService = Depends(get_auth_service),
 ) -> Union[UserResponse, HTTPExceptionResponse, HTTPValidationError]:
     """
     Update the current user's profile.
     """
-    if not access_token:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-    user = await auth_service.check_access(creds=access_token.credentials)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated"
-        )
     try:
-        user_uuid = UUID(user.get("user_id"))
+        user_uuid = UUID(claims.user["user_id"])
         updated_user = await user_service.update_user(user_uuid, body)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
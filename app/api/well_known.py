@@ -0,0 +1,30 @@
+import hashlib
+
+import orjson
+from core.config import auth_settings
+from core.keys import key_ring
+from fastapi import APIRouter, Request, Response, status
+
+router = APIRouter()
+
+JWKS = orjson.dumps(key_ring.jwks())
+JWKS_ETAG = f'"{hashlib.sha256(JWKS).hexdigest()[:32]}"'
+
+
+@router.get(
+    "/.well-known/jwks.json",
+    summary="Public keys to verify tokens",
+    response_class=Response,
+    tags=["Authorization"],
+)
+async def jwks(request: Request) -> Response:
+    """
+    JSON Web Key Set with every key that may have signed a live token.
+    """
+    headers = {
+        "Cache-Control": f"public, max-age={auth_settings.jwks_max_age_seconds}",
+        "ETag": JWKS_ETAG,
+    }
+    if request.headers.get("if-none-match") == JWKS_ETAG:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=JWKS, media_type="application/json", headers=headers)
@@ -0,0 +1,396 @@
+import asyncio
+import logging
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from uuid import uuid4
+
+import httpx
+import jwt
+import typer
+from core.config import auth_settings
+from core.hashing import hash_password, normalize_method, password_hasher
+from core.keys import key_ring
+from db import pg
+from db.redis import follow_revocations
+from models.role import UserRole
+from models.session import Session
+from models.token import Token
+from models.user import User
+from services.database import BaseDb, PostgresqlEngine
+from services.loaders import PROFILES, loader_options
+from services.token import token_minter
+from sqlalchemy import delete, event, insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import selectinload
+from werkzeug.security import check_password_hash, generate_password_hash
+
+app = typer.Typer()
+
+USER_DATA = {
+    "email": "bench@example.com",
+    "user_id": str(uuid4()),
+    "role_mask": 0b101,
+}
+PASSWORD = "correct horse battery staple"
+HASH_METHODS = [
+    "pbkdf2:sha256:300000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "bcrypt:10",
+    "bcrypt:12",
+]
+
+
+def cpu_per_call(func: Callable[[], object], calls: int) -> float:
+    started = time.process_time()
+    for _ in range(calls):
+        func()
+    return (time.process_time() - started) / calls
+
+
+def legacy_login_tokens(user_data: dict) -> tuple[str, str]:
+    """
+    Token work of a login before TokenMinter: encode the pair,
+    then decode both tokens to get their jti and exp back.
+    """
+    tokens = []
+    for refresh in (False, True):
+        payload = {
+            "user": user_data,
+            "exp": datetime.now(tz=timezone.utc)
+            + timedelta(seconds=auth_settings.jwt_access_token_expires_in_seconds),
+            "jti": str(uuid4()),
+            "refresh": refresh,
+        }
+        tokens.append(
+            jwt.encode(
+                payload=payload,
+                key=key_ring.signing_key,
+                algorithm=key_ring.signing_algorithm,
+                headers=key_ring.headers,
+            )
+        )
+
+    for token in tokens:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key, algorithms = key_ring.verification_key(kid)
+        decoded = jwt.decode(token, key=key, algorithms=algorithms)
+        decoded["jti"], decoded["exp"]
+
+    return tuple(tokens)
+
+
+async def call_check_access(
+    client: httpx.AsyncClient, requests: int, concurrency: int
+) -> tuple[list[float], float]:
+    """
+    Latencies of /check_access calls and the time all of them took.
+    """
+    token = token_minter.mint_pair(USER_DATA).access.token
+    headers = {"Authorization": f"Bearer {token}"}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get("/api/v1/auth/check_access", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(requests)))
+    return latencies, time.perf_counter() - started
+
+
+def report_latencies(latencies: list[float], elapsed: float) -> None:
+    percentiles = statistics.quantiles(latencies, n=100)
+    typer.echo(f"throughput: {len(latencies) / elapsed:.0f} req/s")
+    typer.echo(f"p50: {percentiles[49] * 1000:.1f} ms")
+    typer.echo(f"p99: {percentiles[98] * 1000:.1f} ms")
+
+
+@app.callback()
+def main():
+    """
+    Benchmarks for the auth service hot paths.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+@app.command()
+def mint_tokens(logins: int = typer.Option(10000, help="Logins to simulate")):
+    """
+    CPU time spent on tokens per login, with and without decoding them back.
+    """
+    before = cpu_per_call(lambda: legacy_login_tokens(USER_DATA), logins)
+    after = cpu_per_call(lambda: token_minter.mint_pair(USER_DATA), logins)
+
+    typer.echo(f"algorithm: {key_ring.signing_algorithm}")
+    typer.echo(f"encode + decode: {before * 1e6:.1f} us per login")
+    typer.echo(f"mint pair:       {after * 1e6:.1f} us per login")
+    typer.echo(f"saved:           {(1 - after / before) * 100:.0f}%")
+
+
+async def bench_check_access(
+    requests: int, concurrency: int, pool_size: int, hold: float
+) -> None:
+    from main import app as auth_app
+
+    engine = create_async_engine(
+        auth_settings.database_dsn, pool_size=pool_size, max_overflow=0
+    )
+    pg.async_session.configure(bind=engine)
+    checkouts = 0
+    slow_queries = 0
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def count_checkout(*args):
+        nonlocal checkouts
+        checkouts += 1
+
+    stop = asyncio.Event()
+
+    async def keep_pool_busy():
+        nonlocal slow_queries
+        while not stop.is_set():
+            async with pg.async_session() as session:
+                slow_queries += 1
+                await session.execute(text("SELECT pg_sleep(:hold)"), {"hold": hold})
+
+    transport = httpx.ASGITransport(app=auth_app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+        follower = asyncio.create_task(follow_revocations())
+        busy = [asyncio.create_task(keep_pool_busy()) for _ in range(pool_size)]
+        latencies, elapsed = await call_check_access(client, requests, concurrency)
+
+    stop.set()
+    await asyncio.gather(*busy)
+    follower.cancel()
+    await engine.dispose()
+
+    typer.echo(f"pool size: {pool_size}, held by {hold}s queries the whole run")
+    report_latencies(latencies, elapsed)
+    typer.echo(f"pool checkouts by check_access: {checkouts - slow_queries}")
+
+
+@app.command()
+def check_access(
+    requests: int = typer.Option(2000, help="check_access calls to make"),
+    concurrency: int = typer.Option(50, help="Calls in flight at once"),
+    pool_size: int = typer.Option(1, help="Connections in the pool"),
+    hold: float = typer.Option(0.5, help="Seconds a slow query holds a connection"),
+):
+    """
+    /check_access throughput while slow queries keep an undersized pool busy.
+    Needs Postgres and Redis.
+    """
+    asyncio.run(bench_check_access(requests, concurrency, pool_size, hold))
+
+
+async def bench_login_storm(logins: int, requests: int, concurrency: int) -> None:
+    from main import app as auth_app
+
+    hashed_password = generate_password_hash(PASSWORD)
+
+    async def inline_login():
+        # What login did before: hash on the event loop.
+        await asyncio.sleep(0)
+        check_password_hash(hashed_password, PASSWORD)
+
+    async def pooled_login():
+        await password_hasher.verify(hashed_password, PASSWORD)
+
+    transport = httpx.ASGITransport(app=auth_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+        follower = asyncio.create_task(follow_revocations())
+        for name, login in (("on event loop", inline_login), ("on pool", pooled_login)):
+            storm = asyncio.gather(*(login() for _ in range(logins)))
+            latencies, elapsed = await call_check_access(client, requests, concurrency)
+            await storm
+            typer.echo(f"check_access while {logins} logins hash {name}:")
+            report_latencies(latencies, elapsed)
+        follower.cancel()
+    password_hasher.shutdown()
+
+
+@app.command()
+def login_storm(
+    logins: int = typer.Option(300, help="Concurrent logins to hash"),
+    requests: int = typer.Option(2000, help="check_access calls to make"),
+    concurrency: int = typer.Option(50, help="Calls in flight at once"),
+):
+    """
+    /check_access tail latency while a login storm is hashing passwords,
+    with hashing on the event loop and on the password hash pool.
+    Needs Redis.
+    """
+    typer.echo(
+        f"pool: {auth_settings.password_hash_executor}, "
+        f"workers: {auth_settings.password_hash_workers or 'default'}"
+    )
+    asyncio.run(bench_login_storm(logins, requests, concurrency))
+
+
+@app.command()
+def hash_rates(
+    methods: list[str] = typer.Option(HASH_METHODS, "--method", help="Hash method"),
+    hashes: int = typer.Option(20, help="Hashes per method"),
+):
+    """
+    Password hashes per second per core for candidate PASSWORD_HASH_METHOD
+    values. A login costs one hash per password check.
+    """
+    configured = normalize_method(auth_settings.password_hash_method)
+    for method in dict.fromkeys([configured, *map(normalize_method, methods)]):
+        seconds = cpu_per_call(lambda: hash_password(PASSWORD, method), hashes)
+        mark = " (configured)" if method == configured else ""
+        typer.echo(
+            f"{method:<24} {1 / seconds:8.1f} hashes/s per core"
+            f" {seconds * 1000:8.1f} ms per hash{mark}"
+        )
+
+
+async def bench_user_lookup(sessions: int, lookups: int) -> None:
+    email = f"bench-{uuid4()}@example.com"
+    now = int(time.time())
+    async with pg.async_session() as session:
+        user_id = (
+            await session.execute(
+                insert(User)
+                .values(email=email, username=email, hashed_password="-")
+                .returning(User.id)
+            )
+        ).scalar_one()
+        await session.execute(
+            insert(Session),
+            [
+                {"user_id": user_id, "user_agent": f"agent {i}", "user_action": "login"}
+                for i in range(sessions)
+            ],
+        )
+        await session.execute(
+            insert(Token),
+            [{"user_id": user_id, "refresh_exp": now} for _ in range(sessions)],
+        )
+        await session.commit()
+
+    # What every lookup of a user loaded while relationships were selectin.
+    everything = (
+        selectinload(User.roles).joinedload(UserRole.role),
+        selectinload(User.sessions),
+        selectinload(User.tokens),
+    )
+    profiles = {
+        "every relationship": everything,
+        **{profile: loader_options(User, profile) for profile in PROFILES[User]},
+    }
+    try:
+        for name, options in profiles.items():
+            started = time.perf_counter()
+            for _ in range(lookups):
+                async with pg.async_session() as session:
+                    query = select(User).where(User.email == email).options(*options)
+                    (await session.execute(query)).scalars().first()
+            elapsed = (time.perf_counter() - started) / lookups
+            typer.echo(f"{name:<20} {elapsed * 1000:8.1f} ms per lookup")
+    finally:
+        async with pg.async_session() as session:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await pg.engine.dispose()
+
+
+@app.command()
+def user_lookup(
+    sessions: int = typer.Option(10000, help="Sessions and token rows of the user"),
+    lookups: int = typer.Option(20, help="Lookups per loader profile"),
+):
+    """
+    Time of a user lookup by email per loader profile, for a user with a
+    long session and token history. Needs Postgres.
+    """
+    typer.echo(f"user with {sessions} sessions and {sessions} token rows")
+    asyncio.run(bench_user_lookup(sessions, lookups))
+
+
+async def bench_bulk_ops(rows: int) -> None:
+    email = f"bench-{uuid4()}@example.com"
+    async with pg.async_session() as session:
+        user_id = (
+            await session.execute(
+                insert(User)
+                .values(email=email, username=email, hashed_password="-")
+                .returning(User.id)
+            )
+        ).scalar_one()
+        await session.commit()
+
+    def new_rows():
+        return [
+            {"user_id": user_id, "user_agent": f"agent {i}", "user_action": "login"}
+            for i in range(rows)
+        ]
+
+    def report(name: str, started: float) -> None:
+        typer.echo(f"{name:<12} {rows / (time.perf_counter() - started):10.0f} rows/s")
+
+    try:
+        async with pg.async_session() as session:
+            db = BaseDb(PostgresqlEngine(session))
+
+            typer.echo("one row, one commit at a time:")
+            started = time.perf_counter()
+            created = [await db.create(Session(**row), Session) for row in new_rows()]
+            report("create", started)
+            started = time.perf_counter()
+            for obj in created:
+                await db.update(obj.id, {"user_action": "refresh"}, Session)
+            report("update", started)
+            started = time.perf_counter()
+            for obj in created:
+                await db.delete(obj.id, Session)
+            report("delete", started)
+
+            typer.echo("multi-row statements, one transaction:")
+            started = time.perf_counter()
+            created = await db.create_many(new_rows(), Session, commit=False)
+            report("create_many", started)
+            ids = [obj.id for obj in created]
+            started = time.perf_counter()
+            await db.get_many_by_ids(ids, Session)
+            report("get_many", started)
+            started = time.perf_counter()
+            await db.update_many(
+                [{"id": object_id, "user_action": "refresh"} for object_id in ids],
+                Session,
+                commit=False,
+            )
+            report("update_many", started)
+            started = time.perf_counter()
+            await db.delete_many(ids, Session, commit=False)
+            await db.commit()
+            report("delete_many", started)
+    finally:
+        async with pg.async_session() as session:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await pg.engine.dispose()
+
+
+@app.command()
+def bulk_ops(rows: int = typer.Option(5000, help="Session rows to write")):
+    """
+    Rows per second of BaseDb create, update and delete one row at a time
+    against create_many, get_many_by_ids, update_many and delete_many.
+    Needs Postgres.
+    """
+    asyncio.run(bench_bulk_ops(rows))
+
+
+if __name__ == "__main__":
+    app()
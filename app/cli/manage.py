@@ -1,11 +1,25 @@
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
 from asyncio import run
-from uuid import UUID
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+from uuid import UUID, uuid4
 
 import typer
-from db.pg import async_session
+from core.config import auth_settings
+from core.hashing import hash_passwords, normalize_method, password_hasher
+from db.pg import async_session, engine
 from models.role import Role, UserRole
 from models.user import User
-from sqlalchemy import select
+from services.database import BaseDb, PostgresqlEngine
+from services.token_partitions import maintain_token_partitions
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -27,10 +41,14 @@ async def create_user_by_email(db: AsyncSession, email: str) -> bool:
         f"Enter password for {username}", hide_input=True, confirmation_prompt=True
     )
 
-    user = User(email=email, password=password, username=username, full_name=full_name)
+    user = User(
+        email=email,
+        username=username,
+        full_name=full_name,
+        hashed_password=await password_hasher.hash(password),
+    )
     db.add(user)
     await db.commit()
-    await db.refresh(user)
     print(f"{username} has been created.")
     return user.id
 
@@ -46,7 +64,6 @@ async def create_admin_role(db: AsyncSession) -> UUID:
     admin_role = Role(name="admin")
     db.add(admin_role)
     await db.commit()
-    await db.refresh(admin_role)
     print("Роль admin добавлена в базу.")
     return admin_role.id
 
@@ -64,7 +81,6 @@ async def add_admin_role_to_user(db: AsyncSession, user_id, role_id):
     user_role = UserRole(user_id=user_id, role_id=role_id)
     db.add(user_role)
     await db.commit()
-    await db.refresh(user_role)
     print("User has been granted with admin.")
     return True
 
@@ -92,9 +108,236 @@ async def async_main():
                 return True
 
 
-def main():
+IMPORT_COLUMNS = ["id", "email", "username", "full_name", "hashed_password", "roles"]
+
+CREATE_STAGING = text(
+    """
+    CREATE TEMP TABLE import_users (
+        id uuid, email text, username text, full_name text,
+        hashed_password text, roles text[]
+    ) ON COMMIT DROP
+    """
+)
+CREATE_ROLES = text(
+    """
+    INSERT INTO roles (id, name, created_at)
+    SELECT gen_random_uuid(), name, now()
+    FROM (SELECT DISTINCT unnest(roles) AS name FROM import_users) AS names
+    ON CONFLICT (name) DO NOTHING
+    """
+)
+INSERT_USERS = text(
+    """
+    INSERT INTO users (id, email, username, full_name, hashed_password, created_at)
+    SELECT id, email, username, full_name, hashed_password, now()
+    FROM import_users
+    ON CONFLICT DO NOTHING
+    """
+)
+# Only users inserted by this batch have the ids generated for it.
+INSERT_USER_ROLES = text(
+    """
+    INSERT INTO user_roles (id, user_id, role_id, created_at)
+    SELECT gen_random_uuid(), users.id, roles.id, now()
+    FROM import_users
+    JOIN users ON users.id = import_users.id
+    CROSS JOIN LATERAL unnest(import_users.roles) AS role_name
+    JOIN roles ON roles.name = role_name
+    """
+)
+
+
+def read_users(lines: Iterable[str], fmt: str) -> Iterator[dict]:
+    """
+    Users from CSV with a header or from NDJSON. Columns: email, username,
+    full_name, password or hashed_password, roles (a list in NDJSON,
+    separated by ``;`` in CSV).
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            row["roles"] = [
+                role for role in (row.get("roles") or "").split(";") if role
+            ]
+            yield row
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def hash_batch(
+    pool: ProcessPoolExecutor, users: list[dict], method: str, workers: int
+) -> list[tuple]:
+    """
+    Staging records for a batch, hashing plain passwords across the pool.
+    """
+    loop = asyncio.get_running_loop()
+    plain = [user for user in users if not user.get("hashed_password")]
+    size = max(len(plain) // workers, 1)
+    remaining = iter(plain)
+    chunks = list(iter(lambda: list(islice(remaining, size)), []))
+    hashed = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool, hash_passwords, [user["password"] for user in chunk], method
+            )
+            for chunk in chunks
+        )
+    )
+    for chunk, hashes in zip(chunks, hashed):
+        for user, hashed_password in zip(chunk, hashes):
+            user["hashed_password"] = hashed_password
+
+    return [
+        (
+            uuid4(),
+            user["email"],
+            user.get("username") or None,
+            user.get("full_name") or None,
+            user["hashed_password"],
+            list(user.get("roles") or ()),
+        )
+        for user in users
+    ]
+
+
+async def load_batch(records: list[tuple]) -> int:
+    """
+    COPY a batch into a staging table and move it into users and
+    user_roles in one transaction. Returns how many users were inserted;
+    users whose email or username already exists are skipped, which makes
+    a repeated batch harmless.
+    """
+    async with engine.begin() as connection:
+        await connection.execute(CREATE_STAGING)
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "import_users", records=records, columns=IMPORT_COLUMNS
+        )
+        await connection.execute(CREATE_ROLES)
+        inserted = (await connection.execute(INSERT_USERS)).rowcount
+        await connection.execute(INSERT_USER_ROLES)
+    return inserted
+
+
+async def import_users_from(
+    lines: Iterable[str],
+    fmt: str,
+    state: Optional[str],
+    batch_size: int,
+    workers: int,
+) -> None:
+    done = 0
+    if state and os.path.exists(state):
+        with open(state) as f:
+            done = int(f.read() or 0)
+        typer.echo(f"Resuming after {done} rows")
+
+    users = islice(read_users(lines, fmt), done, None)
+    batches = iter(lambda: list(islice(users, batch_size)), [])
+    method = normalize_method(auth_settings.password_hash_method)
+    processed = inserted = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def prepare_next():
+            batch = next(batches, None)
+            return batch and asyncio.ensure_future(
+                hash_batch(pool, batch, method, workers)
+            )
+
+        # The next batch is hashed while the current one is being loaded.
+        pending = prepare_next()
+        try:
+            while pending:
+                records = await pending
+                pending = prepare_next()
+
+                inserted += await load_batch(records)
+                processed += len(records)
+                if state:
+                    with open(state, "w") as f:
+                        f.write(str(done + processed))
+
+                rate = processed / (time.monotonic() - started)
+                typer.echo(
+                    f"{done + processed} rows, {inserted} users imported, "
+                    f"{rate:.0f} rows/s"
+                )
+        finally:
+            if pending:
+                pending.cancel()
+
+    await engine.dispose()
+    typer.echo(f"Done: {inserted} users imported, {processed - inserted} skipped")
+
+
+async def maintain_tokens_now(ahead: int) -> None:
+    async with async_session() as session:
+        created, dropped = await maintain_token_partitions(
+            BaseDb(PostgresqlEngine(session)), datetime.now().date(), ahead
+        )
+    await engine.dispose()
+    typer.echo(f"Created: {', '.join(created) or 'none'}")
+    typer.echo(f"Dropped: {', '.join(dropped) or 'none'}")
+
+
+app = typer.Typer()
+
+
+@app.command()
+def create_admin():
+    """
+    Create an admin user interactively, or grant admin to an existing one.
+    """
     run(async_main())
 
 
+@app.command()
+def import_users(
+    path: str = typer.Argument(..., help="CSV or NDJSON file, - for stdin"),
+    fmt: str = typer.Option(None, "--format", help="csv or ndjson, by extension"),
+    state: str = typer.Option(
+        None, help="File to keep progress in, <path>.imported by default"
+    ),
+    batch_size: int = typer.Option(5000, help="Users per COPY batch"),
+    workers: int = typer.Option(os.cpu_count(), help="Password hashing processes"),
+):
+    """
+    Import users in bulk. Plain passwords are hashed with the configured
+    PASSWORD_HASH_METHOD, hashed_password values are stored as they are.
+    Roles that do not exist yet are created. Interrupted imports resume
+    from the last loaded batch.
+    """
+    fmt = fmt or ("csv" if path.endswith(".csv") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise typer.BadParameter(f"Unknown format {fmt}")
+    if path == "-":
+        run(import_users_from(sys.stdin, fmt, state, batch_size, workers))
+        return
+
+    with open(path, newline="") as lines:
+        run(
+            import_users_from(
+                lines, fmt, state or f"{path}.imported", batch_size, workers
+            )
+        )
+
+
+@app.command()
+def maintain_tokens(
+    ahead: int = typer.Option(
+        auth_settings.token_partitions_ahead_days, help="Days to create partitions for"
+    ),
+):
+    """
+    Create upcoming daily partitions of the tokens table and drop the ones
+    whose refresh tokens have all expired. The app does the same every
+    TOKEN_PARTITION_MAINTENANCE_SECONDS.
+    """
+    run(maintain_tokens_now(ahead))
+
+
 if __name__ == "__main__":
-    typer.run(main)
+    app()
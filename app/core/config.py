@@ -1,5 +1,6 @@
 import os
 from logging import config as logging_config
+from typing import Optional
 
 from async_fastapi_jwt_auth import AuthJWT
 from core.logger import LOGGING
@@ -31,10 +32,50 @@ class AuthSettings(BaseSettings):
     authjwt_secret_key: str
     authjwt_algorithm: str = "HS256"
 
+    jwt_keys_dir: Optional[str] = None
+    jwt_active_kid: Optional[str] = None
+    jwks_max_age_seconds: int = 3600
+
     jwt_access_token_expires_in_seconds: int = 1800
     jwt_refresh_token_expires_in_days: int = 30
 
     pg_echo: bool = False
+    pg_pool_size: int = 5
+    pg_max_overflow: int = 10
+    pg_pool_timeout: float = 30
+    pg_pool_recycle: int = -1
+    pg_pool_pre_ping: bool = False
+    pg_statement_cache_size: int = 100
+    pg_command_timeout: Optional[float] = None
+    # Behind PgBouncer in transaction mode: no prepared statement reuse
+    # and no pool of our own.
+    pg_pgbouncer: bool = False
+
+    # Keep a row per issued pair in the tokens table, for audit only.
+    token_audit: bool = True
+    token_partitions_ahead_days: int = 7
+    token_partition_maintenance_seconds: float = 3600
+
+    token_cache_size: int = 10000
+    token_cache_ttl_seconds: int = 60
+
+    revocation_stream: str = "revoked_jti"
+    revocation_max_staleness_seconds: float = 5.0
+
+    check_access_batch_max: int = 100
+    auth_request_cache_seconds: int = 5
+
+    role_registry_refresh_seconds: float = 60.0
+
+    login_throttle_window_seconds: int = 60
+    login_attempts_per_email: int = 5
+    login_attempts_per_ip: int = 50
+    login_lockout_seconds: int = 60
+    login_lockout_max_seconds: int = 3600
+
+    password_hash_method: str = "scrypt:32768:8:1"
+    password_hash_executor: str = "thread"
+    password_hash_workers: Optional[int] = None
 
     @property
     def redis_dsn(self):
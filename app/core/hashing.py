@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+from core.config import auth_settings
+from werkzeug.security import check_password_hash, generate_password_hash
+
+BCRYPT = "bcrypt"
+BCRYPT_DEFAULT_ROUNDS = 12
+
+
+def normalize_method(method: str) -> str:
+    """
+    Full form of a hash method with its defaults filled in, as it is
+    written in front of the hashes it produces: ``scrypt:32768:8:1``,
+    ``pbkdf2:sha256:600000`` or ``bcrypt:12``.
+    """
+    name, _, rounds = method.partition(":")
+    if name == BCRYPT:
+        return f"{BCRYPT}:{int(rounds or BCRYPT_DEFAULT_ROUNDS)}"
+    return generate_password_hash("", method).partition("$")[0]
+
+
+def hash_password(password: str, method: str) -> str:
+    name, _, rounds = method.partition(":")
+    if name == BCRYPT:
+        rounds = int(rounds or BCRYPT_DEFAULT_ROUNDS)
+        hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds))
+        return f"{BCRYPT}:{rounds}${hashed.decode()}"
+    return generate_password_hash(password, method)
+
+
+def hash_passwords(passwords: list[str], method: str) -> list[str]:
+    """
+    A chunk of passwords hashed in one call, to send a chunk rather than
+    every single password to a process pool.
+    """
+    return [hash_password(password, method) for password in passwords]
+
+
+def check_password(hashed_password: str, password: str) -> bool:
+    method, _, hashed = hashed_password.partition("$")
+    if method.partition(":")[0] == BCRYPT:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    return check_password_hash(hashed_password, password)
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords on a pool, off the event loop, with the
+    configured method.
+
+    hashlib releases the GIL while it hashes, so threads are enough for the
+    werkzeug schemes; a process pool keeps even pure Python hashers away
+    from the worker's event loop. The pool is created on first use, after
+    gunicorn has forked the worker.
+    """
+
+    def __init__(
+        self,
+        method: str = "scrypt",
+        executor: str = "thread",
+        workers: Optional[int] = None,
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor {executor}")
+        self.method = normalize_method(method)
+        self.executor_kind = executor
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, hash_password, password, self.method
+        )
+
+    async def verify(self, hashed_password: str, password: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, check_password, hashed_password, password
+        )
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """
+        Whether the hash was made with another method or cost than the
+        configured one.
+        """
+        return hashed_password.partition("$")[0] != self.method
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    method=auth_settings.password_hash_method,
+    executor=auth_settings.password_hash_executor,
+    workers=auth_settings.password_hash_workers,
+)
@@ -0,0 +1,117 @@
+import os
+from typing import Any, Optional
+
+from core.config import auth_settings
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+
+class KeyRing:
+    """
+    Keys used to sign and verify tokens.
+
+    Without a keys directory tokens are signed with the shared secret.
+    Otherwise every ``<kid>.pem`` in the directory is loaded: private keys
+    can sign, public keys are kept only to verify tokens issued before a
+    rotation. All of them are published in the JWKS, and tokens signed
+    with the shared secret are no longer accepted.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        secret: str,
+        keys_dir: Optional[str] = None,
+        active_kid: Optional[str] = None,
+    ):
+        self.secret = secret
+        self.secret_algorithm = algorithm
+        self.private_keys: dict[str, Any] = {}
+        self.public_keys: dict[str, Any] = {}
+        self.algorithms: dict[str, str] = {}
+        self.active_kid: Optional[str] = None
+
+        if keys_dir:
+            self._load(keys_dir, algorithm)
+            self.active_kid = active_kid or self._newest_private_kid(keys_dir)
+            if self.active_kid not in self.private_keys:
+                raise ValueError(f"No private key for kid {self.active_kid}")
+
+    def _load(self, keys_dir: str, algorithm: str) -> None:
+        for file_name in sorted(os.listdir(keys_dir)):
+            kid, ext = os.path.splitext(file_name)
+            if ext != ".pem":
+                continue
+            with open(os.path.join(keys_dir, file_name), "rb") as f:
+                pem = f.read()
+
+            if b"PRIVATE KEY" in pem:
+                private_key = serialization.load_pem_private_key(pem, password=None)
+                self.private_keys[kid] = private_key
+                public_key = private_key.public_key()
+            else:
+                public_key = serialization.load_pem_public_key(pem)
+
+            self.public_keys[kid] = public_key
+            self.algorithms[kid] = self._algorithm_for(public_key, algorithm)
+
+    def _newest_private_kid(self, keys_dir: str) -> Optional[str]:
+        if not self.private_keys:
+            return None
+        return max(
+            self.private_keys,
+            key=lambda kid: os.path.getmtime(os.path.join(keys_dir, f"{kid}.pem")),
+        )
+
+    @staticmethod
+    def _algorithm_for(public_key: Any, algorithm: str) -> str:
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            return "EdDSA"
+        if isinstance(public_key, rsa.RSAPublicKey):
+            return algorithm if algorithm[:2] in ("RS", "PS") else "RS256"
+        raise ValueError(f"Unsupported key type {type(public_key).__name__}")
+
+    @property
+    def signing_algorithm(self) -> str:
+        if self.active_kid:
+            return self.algorithms[self.active_kid]
+        return self.secret_algorithm
+
+    @property
+    def signing_key(self) -> Any:
+        if self.active_kid:
+            return self.private_keys[self.active_kid]
+        return self.secret
+
+    @property
+    def headers(self) -> Optional[dict]:
+        if self.active_kid:
+            return {"kid": self.active_kid}
+        return None
+
+    def verification_key(self, kid: Optional[str]) -> tuple[Any, list[str]]:
+        if not self.public_keys:
+            return self.secret, [self.secret_algorithm]
+        if kid not in self.public_keys:
+            raise KeyError(f"Unknown kid {kid}")
+        return self.public_keys[kid], [self.algorithms[kid]]
+
+    def jwks(self) -> dict:
+        keys = []
+        for kid, public_key in self.public_keys.items():
+            if isinstance(public_key, rsa.RSAPublicKey):
+                jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+            else:
+                jwk = OKPAlgorithm.to_jwk(public_key, as_dict=True)
+            jwk.update({"kid": kid, "alg": self.algorithms[kid], "use": "sig"})
+            keys.append(jwk)
+        return {"keys": keys}
+
+
+key_ring = KeyRing(
+    algorithm=auth_settings.authjwt_algorithm,
+    secret=auth_settings.authjwt_secret_key,
+    keys_dir=auth_settings.jwt_keys_dir,
+    active_kid=auth_settings.jwt_active_kid,
+)
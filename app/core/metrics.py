@@ -0,0 +1,53 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# gunicorn runs several workers: with PROMETHEUS_MULTIPROC_DIR set every
+# worker writes its samples there and /metrics aggregates all of them.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+login_attempts_throttled = Counter(
+    "auth_login_attempts_throttled_total",
+    "Login attempts refused by the login throttle",
+    ["scope"],
+)
+
+singleflight_calls = Counter(
+    "auth_singleflight_calls_total",
+    "Lookups by whether they ran or joined one already in flight",
+    ["flight", "outcome"],
+)
+
+# Pool gauges are per worker: every worker has a pool of its own.
+db_pool_checked_out = Gauge(
+    "auth_db_pool_checked_out",
+    "Database connections checked out of the pool",
+    multiprocess_mode="liveall",
+)
+db_pool_overflow = Gauge(
+    "auth_db_pool_overflow",
+    "Database connections open above the pool size",
+    multiprocess_mode="liveall",
+)
+db_pool_wait_seconds = Histogram(
+    "auth_db_pool_wait_seconds",
+    "Time a checkout waited for a database connection",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from core.metrics import singleflight_calls
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within one worker: the
+    first caller runs the call, callers arriving while it is in flight
+    wait for its result instead of repeating it.
+
+    A failed or cancelled call is not shared, its waiters run the call
+    again themselves.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(
+        self, key: Hashable, func: Callable[[], Awaitable[T]]
+    ) -> tuple[T, bool]:
+        """
+        Result of func for the key and whether it was shared from a call
+        already in flight.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            singleflight_calls.labels(self.name, "coalesced").inc()
+            try:
+                return await asyncio.shield(call), True
+            except asyncio.CancelledError:
+                if not call.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            return await self.do(key, func)
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        singleflight_calls.labels(self.name, "executed").inc()
+        try:
+            result = await func()
+        except BaseException:
+            call.cancel()
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
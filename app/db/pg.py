@@ -1,23 +1,125 @@
-from core.config import auth_settings
+import time
+from typing import Any, Optional
+from uuid import uuid4
+
+from core.config import AuthSettings, auth_settings
+from core.metrics import db_pool_checked_out, db_pool_overflow, db_pool_wait_seconds
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from sqlalchemy.ext.asyncio import create_async_engine  # isort: skip
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker  # isort: skip
 
 Base = declarative_base()
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that reports how long a checkout waited for a connection.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
+
+
+def engine_options(settings: AuthSettings) -> dict:
+    """
+    Pool and asyncpg options of the engine. Every gunicorn worker has its
+    own pool, so a worker opens up to pg_pool_size + pg_max_overflow
+    connections.
+    """
+    connect_args = {
+        "statement_cache_size": settings.pg_statement_cache_size,
+        "prepared_statement_cache_size": settings.pg_statement_cache_size,
+        "command_timeout": settings.pg_command_timeout,
+    }
+    if settings.pg_pgbouncer:
+        # In transaction mode consecutive statements may run on different
+        # server connections: no statement can be expected to be prepared
+        # already, and names must not clash. PgBouncer does the pooling.
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__",
+        )
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.pg_pool_size,
+        "max_overflow": settings.pg_max_overflow,
+        "pool_timeout": settings.pg_pool_timeout,
+        "pool_recycle": settings.pg_pool_recycle,
+        "pool_pre_ping": settings.pg_pool_pre_ping,
+        "connect_args": connect_args,
+    }
+
+
+def report_pool(engine: AsyncEngine) -> None:
+    """
+    Keep the pool gauges of this worker up to date.
+    """
+    pool = engine.pool
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def checked_out(*args):
+        db_pool_checked_out.inc()
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            db_pool_overflow.set(max(pool.overflow(), 0))
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def checked_in(*args):
+        db_pool_checked_out.dec()
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            db_pool_overflow.set(max(pool.overflow(), 0))
+
+
 engine = create_async_engine(
-    auth_settings.database_dsn, echo=auth_settings.pg_echo, future=True
+    auth_settings.database_dsn,
+    echo=auth_settings.pg_echo,
+    future=True,
+    **engine_options(auth_settings),
 )
+report_pool(engine)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+class LazySession:
+    """
+    Stands in for an AsyncSession and opens the real one on first use,
+    so requests that never query the database never touch the pool.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self._session_factory = session_factory
+        self._session: Optional[AsyncSession] = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_factory()
+        return getattr(self._session, name)
+
+    async def rollback(self) -> None:
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
 async def get_session() -> AsyncSession:
-    async with async_session() as session:
-        try:
-            yield session
-        except Exception:
-            await session.rollback()
-            raise
-        finally:
-            await session.close()
+    session = LazySession(async_session)
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
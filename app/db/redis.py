@@ -1,6 +1,13 @@
+import asyncio
+import time
+from typing import Optional
+
 from core.config import auth_settings
 from core.logger import logger
+from db.revocation import millis, revocation_replica
+from db.token_cache import token_cache
 from redis.asyncio import Redis, from_url
+from redis.exceptions import RedisError
 
 redis: Redis | None = None
 
@@ -10,19 +17,167 @@ async def get_redis() -> Redis:
 
 
 JTI_EXPIRY = 3600
+REVOCATION_BATCH = 1000
 
 token_blocklist = from_url(auth_settings.redis_dsn)
 
 
-async def add_jti_to_blocklist(jti: str) -> None:
-    logger.info(f"Will add token {jti} to blacklist")
-    await token_blocklist.set(
-        name=jti, value="", ex=auth_settings.jwt_access_token_expires_in_seconds
+def revocation_stream_id(timestamp: float) -> str:
+    return f"{int(timestamp * 1000)}-0"
+
+
+# KEYS: revocation stream, not-before key of the user, refresh jti and
+# the jti of its access token if known; ARGV[1] is its iat in ms. Refuse
+# if the refresh token is blocklisted or was issued no later than the
+# user's not-before epoch, otherwise
+# blocklist every jti, so only one rotation of a refresh token succeeds.
+REVOKE_REFRESHED = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+local not_before = redis.call('GET', KEYS[2])
+if not_before and tonumber(ARGV[1]) <= tonumber(not_before) then
+    return 0
+end
+
+for i = 3, #KEYS do
+    redis.call('SET', KEYS[i], '', 'EX', ARGV[2])
+    redis.call('XADD', KEYS[1], 'MINID', ARGV[3], '*', 'jti', KEYS[i], 'exp', ARGV[4])
+end
+return 1
+"""
+revoke_refreshed = token_blocklist.register_script(REVOKE_REFRESHED)
+
+
+def not_before_key(user_id: str) -> str:
+    return f"not_before:{user_id}"
+
+
+def forget_revoked(jti: str, expires_at: float) -> None:
+    revocation_replica.add(jti, expires_at)
+    token_cache.invalidate(jti)
+
+
+async def add_jti_to_blocklist(*jtis: str) -> None:
+    logger.info(f"Will add tokens {jtis} to blacklist")
+    ttl = auth_settings.jwt_access_token_expires_in_seconds
+    now = time.time()
+    async with token_blocklist.pipeline(transaction=True) as pipe:
+        for jti in jtis:
+            pipe.set(name=jti, value="", ex=ttl)
+            pipe.xadd(
+                auth_settings.revocation_stream,
+                {"jti": jti, "exp": now + ttl},
+                minid=revocation_stream_id(now - ttl),
+            )
+        await pipe.execute()
+
+    for jti in jtis:
+        forget_revoked(jti, now + ttl)
+
+
+async def revoke_refreshed_pair(
+    refresh_jti: str, access_jti: Optional[str], user_id: str, iat: float
+) -> bool:
+    """
+    Check that a refresh token is still valid and blocklist it together
+    with its access token in one atomic call. False if it was already
+    revoked, e.g. by a concurrent refresh with the same token.
+    """
+    logger.info(f"Will rotate refresh token {refresh_jti}")
+    ttl = auth_settings.jwt_access_token_expires_in_seconds
+    now = time.time()
+    jtis = [jti for jti in (refresh_jti, access_jti) if jti]
+    rotated = await revoke_refreshed(
+        keys=[auth_settings.revocation_stream, not_before_key(user_id), *jtis],
+        args=[millis(iat), ttl, revocation_stream_id(now - ttl), now + ttl],
     )
+    if not rotated:
+        return False
+
+    for jti in jtis:
+        forget_revoked(jti, now + ttl)
+    return True
+
 
+async def revoke_user_tokens(user_id: str) -> int:
+    """
+    Reject every token of the user issued until now with a single key,
+    whatever the number of tokens. Returns the new not-before epoch in ms.
+    """
+    logger.info(f"Will revoke all tokens of user {user_id}")
+    ttl = auth_settings.jwt_access_token_expires_in_seconds
+    now = time.time()
+    # Tokens minted within the same millisecond are revoked as well, so
+    # none issued before the call can outlive it.
+    epoch = millis(now)
+    async with token_blocklist.pipeline(transaction=True) as pipe:
+        pipe.set(name=not_before_key(user_id), value=epoch, ex=ttl)
+        pipe.xadd(
+            auth_settings.revocation_stream,
+            {"user_id": user_id, "not_before": epoch, "exp": now + ttl},
+            minid=revocation_stream_id(now - ttl),
+        )
+        await pipe.execute()
 
-async def token_in_blocklist(jti: str) -> bool:
-    logger.info(f"check if token {jti} in blacklist")
-    jti = await token_blocklist.get(jti)
+    revocation_replica.add_not_before(user_id, epoch, now + ttl)
+    return epoch
+
+
+async def tokens_in_blocklist(tokens: list[tuple[str, str, float]]) -> list[bool]:
+    """
+    Revocation status of (jti, user_id, iat) tokens: blocklisted or issued
+    no later than the user's not-before epoch. At most one MGET for all of them.
+    """
+    revoked = [revocation_replica.is_revoked(*token) for token in tokens]
+    unknown = [token for token, answer in zip(tokens, revoked) if answer is None]
+    if unknown:
+        logger.info(f"check if tokens {[jti for jti, _, _ in unknown]} in blacklist")
+        keys = []
+        for jti, user_id, _ in unknown:
+            keys += [jti, not_before_key(user_id)]
+        fetched = await token_blocklist.mget(keys)
+        answers = iter(
+            blocked is not None or (epoch is not None and millis(iat) <= int(epoch))
+            for (_, _, iat), blocked, epoch in zip(unknown, fetched[::2], fetched[1::2])
+        )
+        revoked = [next(answers) if answer is None else answer for answer in revoked]
+    return revoked
+
+
+async def follow_revocations() -> None:
+    """
+    Replay the revocation stream into the local replica and keep following it.
+    Starts from the oldest entry that can still refer to a live token.
+    """
+    last_id = revocation_stream_id(
+        time.time() - auth_settings.jwt_access_token_expires_in_seconds
+    )
+    block = max(int(auth_settings.revocation_max_staleness_seconds * 500), 1)
+    while True:
+        try:
+            response = await token_blocklist.xread(
+                {auth_settings.revocation_stream: last_id},
+                count=REVOCATION_BATCH,
+                block=block,
+            )
+            received = 0
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    if b"user_id" in fields:
+                        revocation_replica.add_not_before(
+                            fields[b"user_id"].decode(),
+                            int(fields[b"not_before"]),
+                            float(fields[b"exp"]),
+                        )
+                    else:
+                        forget_revoked(fields[b"jti"].decode(), float(fields[b"exp"]))
+                    last_id = entry_id
+                    received += 1
 
-    return jti is not None
+            # A full batch means there is more backlog to catch up on.
+            if received < REVOCATION_BATCH:
+                revocation_replica.mark_synced()
+        except RedisError as e:
+            logger.error(f"Revocation stream is unavailable: {e}")
+            await asyncio.sleep(1)
@@ -0,0 +1,89 @@
+import time
+from typing import Optional
+
+from core.config import auth_settings
+
+PRUNE_INTERVAL = 60
+
+
+def millis(timestamp: float) -> int:
+    """
+    Milliseconds of a unix timestamp, the resolution of token iat and of
+    not-before epochs.
+    """
+    return round(timestamp * 1000)
+
+
+class RevocationReplica:
+    """
+    In-memory copy of the jti blocklist and of the per-user not-before
+    epochs, fed by the revocation stream.
+
+    Answers are only trusted while the feed has been read recently,
+    otherwise callers have to fall back to Redis.
+    """
+
+    def __init__(self, max_staleness: float):
+        self.max_staleness = max_staleness
+        self.synced_at: Optional[float] = None
+        self._expires: dict[str, float] = {}
+        self._not_before: dict[str, tuple[int, float]] = {}
+        self._pruned_at = time.monotonic()
+
+    def is_fresh(self) -> bool:
+        return (
+            self.synced_at is not None
+            and time.monotonic() - self.synced_at <= self.max_staleness
+        )
+
+    def mark_synced(self) -> None:
+        self.synced_at = time.monotonic()
+        if self.synced_at - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._expires[jti] = max(expires_at, self._expires.get(jti, 0))
+
+    def add_not_before(self, user_id: str, epoch: int, expires_at: float) -> None:
+        current = self._not_before.get(user_id)
+        if current is None or epoch >= current[0]:
+            self._not_before[user_id] = (epoch, expires_at)
+
+    def contains(self, jti: str) -> Optional[bool]:
+        if not self.is_fresh():
+            return None
+        expires_at = self._expires.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def is_revoked(self, jti: str, user_id: str, iat: float) -> Optional[bool]:
+        """
+        Whether the token is blocklisted or was issued no later than the
+        user's not-before epoch. None if the replica is stale.
+        """
+        revoked = self.contains(jti)
+        if not revoked and revoked is not None:
+            epoch, expires_at = self._not_before.get(user_id, (0, 0))
+            revoked = millis(iat) <= epoch and expires_at > time.time()
+        return revoked
+
+    def prune(self) -> None:
+        now = time.time()
+        self._expires = {
+            jti: expires_at
+            for jti, expires_at in self._expires.items()
+            if expires_at > now
+        }
+        self._not_before = {
+            user_id: entry
+            for user_id, entry in self._not_before.items()
+            if entry[1] > now
+        }
+        self._pruned_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+revocation_replica = RevocationReplica(
+    max_staleness=auth_settings.revocation_max_staleness_seconds
+)
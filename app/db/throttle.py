@@ -0,0 +1,131 @@
+import time
+from typing import NamedTuple, Optional
+from uuid import uuid4
+
+from core.config import auth_settings
+from core.logger import logger
+from db.redis import token_blocklist
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+# For every subject (KEYS come in threes: attempts, lock, strikes):
+# refuse while it is locked out; drop attempts older than the window and,
+# if the limit is already reached, lock it out for a period that doubles
+# with every lockout in a row. Only when no subject is over its limit is
+# the attempt recorded for all of them, so nothing is half counted.
+SLIDING_WINDOW = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local lockout = tonumber(ARGV[3])
+local max_lockout = tonumber(ARGV[4])
+local member = ARGV[5]
+
+for i = 1, #KEYS / 3 do
+    local attempts, lock, strikes = KEYS[i * 3 - 2], KEYS[i * 3 - 1], KEYS[i * 3]
+    local locked = redis.call('PTTL', lock)
+    if locked > 0 then
+        return {locked, i}
+    end
+
+    redis.call('ZREMRANGEBYSCORE', attempts, '-inf', now - window)
+    if redis.call('ZCARD', attempts) >= tonumber(ARGV[5 + i]) then
+        local strike = redis.call('INCR', strikes)
+        redis.call('PEXPIRE', strikes, max_lockout * 2)
+        locked = math.floor(math.min(lockout * 2 ^ (strike - 1), max_lockout))
+        redis.call('SET', lock, 1, 'PX', locked)
+        return {locked, i}
+    end
+end
+
+for i = 1, #KEYS / 3 do
+    redis.call('ZADD', KEYS[i * 3 - 2], now, member)
+    redis.call('PEXPIRE', KEYS[i * 3 - 2], window)
+end
+return {0, 0}
+"""
+
+
+class Verdict(NamedTuple):
+    retry_after: float = 0
+    scope: Optional[str] = None
+
+
+class LoginThrottle:
+    """
+    Sliding window limits on login attempts per email and per client IP,
+    with progressive lockout, checked atomically in Redis before a login
+    touches the database or hashes a password.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        window: int,
+        per_email: int,
+        per_ip: int,
+        lockout: int,
+        max_lockout: int,
+    ):
+        self.window = window
+        self.limits = {"email": per_email, "ip": per_ip}
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self._script = redis.register_script(SLIDING_WINDOW)
+        self._redis = redis
+
+    @staticmethod
+    def keys(scope: str, subject: str) -> list[str]:
+        return [
+            f"login:{kind}:{scope}:{subject}" for kind in ("try", "lock", "strikes")
+        ]
+
+    async def hit(self, email: str, ip: str) -> Verdict:
+        """
+        Count a login attempt. A verdict with retry_after means the attempt
+        is refused and the scope that is locked out.
+        """
+        subjects = {"email": email.lower(), "ip": ip}
+        try:
+            locked, index = await self._script(
+                keys=[
+                    key
+                    for scope, subject in subjects.items()
+                    for key in self.keys(scope, subject)
+                ],
+                args=[
+                    int(time.time() * 1000),
+                    self.window * 1000,
+                    self.lockout * 1000,
+                    self.max_lockout * 1000,
+                    str(uuid4()),
+                    *(self.limits[scope] for scope in subjects),
+                ],
+            )
+        except RedisError as e:
+            # Logins keep working without Redis, only unthrottled.
+            logger.error(f"Login throttle is unavailable: {e}")
+            return Verdict()
+
+        if not locked:
+            return Verdict()
+        return Verdict(int(locked) / 1000, list(subjects)[int(index) - 1])
+
+    async def reset(self, email: str) -> None:
+        """
+        Forget the failed attempts of an email after a successful login.
+        """
+        keys = self.keys("email", email.lower())
+        try:
+            await self._redis.delete(keys[0], keys[2])
+        except RedisError as e:
+            logger.error(f"Login throttle is unavailable: {e}")
+
+
+login_throttle = LoginThrottle(
+    token_blocklist,
+    window=auth_settings.login_throttle_window_seconds,
+    per_email=auth_settings.login_attempts_per_email,
+    per_ip=auth_settings.login_attempts_per_ip,
+    lockout=auth_settings.login_lockout_seconds,
+    max_lockout=auth_settings.login_lockout_max_seconds,
+)
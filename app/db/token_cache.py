@@ -0,0 +1,76 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from core.config import auth_settings
+from schemas.auth import Payload
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of already verified tokens.
+
+    Entries are keyed by the sha256 digest of the token and live until
+    the configured ttl or the token's own exp, whichever comes first.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._entries: OrderedDict[str, tuple[float, str, Payload]] = OrderedDict()
+        self._digests_by_jti: dict[str, str] = {}
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Payload]:
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, jti, payload = entry
+        if expires_at <= time.time():
+            self._evict(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(
+        self, token: str, payload: Payload, jti: str, exp: float, version: int
+    ) -> None:
+        # A revocation arrived while the token was being verified,
+        # the result may already be stale.
+        if version != self.version or self.maxsize <= 0:
+            return
+
+        expires_at = min(time.time() + self.ttl, exp)
+        key = self.digest(token)
+        self._entries[key] = (expires_at, jti, payload)
+        self._entries.move_to_end(key)
+        self._digests_by_jti[jti] = key
+
+        while len(self._entries) > self.maxsize:
+            self._evict(next(iter(self._entries)))
+
+    def invalidate(self, jti: str) -> None:
+        self.version += 1
+        key = self._digests_by_jti.pop(jti, None)
+        if key is not None:
+            self._entries.pop(key, None)
+
+    def _evict(self, key: str) -> None:
+        _, jti, _ = self._entries.pop(key)
+        self._digests_by_jti.pop(jti, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_cache = TokenCache(
+    maxsize=auth_settings.token_cache_size, ttl=auth_settings.token_cache_ttl_seconds
+)
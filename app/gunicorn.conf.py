@@ -0,0 +1,17 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Samples of a previous run would be added to the new ones.
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
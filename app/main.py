@@ -1,9 +1,15 @@
+import asyncio
+
+from api import metrics, well_known
 from api.v1 import auth, roles, users
 from core.config import auth_settings
+from core.hashing import password_hasher
 from db import redis
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 from redis.asyncio import Redis
+from services.role_registry import refresh_role_registry
+from services.token_partitions import run_token_partition_maintenance
 
 app = FastAPI(
     title=auth_settings.project_name,
@@ -16,13 +22,24 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup():
     redis.redis = Redis.from_url(auth_settings.redis_dsn)
+    app.state.revocation_listener = asyncio.create_task(redis.follow_revocations())
+    app.state.role_registry_refresher = asyncio.create_task(refresh_role_registry())
+    app.state.token_partition_maintainer = asyncio.create_task(
+        run_token_partition_maintenance()
+    )
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    app.state.revocation_listener.cancel()
+    app.state.role_registry_refresher.cancel()
+    app.state.token_partition_maintainer.cancel()
+    password_hasher.shutdown()
     await redis.redis.close()
 
 
 app.include_router(auth.router, prefix="/api/v1/auth")
 app.include_router(roles.router, prefix="/api/v1/roles")
 app.include_router(users.router, prefix="/api/v1/users")
+app.include_router(well_known.router)
+app.include_router(metrics.router)
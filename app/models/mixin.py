@@ -1,14 +1,20 @@
-from datetime import datetime
 from uuid import uuid4
 
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, func
 from sqlalchemy.dialects.postgresql import UUID
 
 
 class IdMixin(object):
+    # Ids are minted here rather than by the database default, so multi-row
+    # INSERT ... RETURNING can use them to return rows in parameter order.
+    # The tables keep gen_random_uuid() for inserts that send no id.
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
 
+    # Values the database fills in come back with RETURNING on the INSERT
+    # or UPDATE itself, not with another SELECT.
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class TimestampMixin(object):
-    created_at = Column(DateTime, default=datetime.now())
-    modified_at = Column(DateTime, onupdate=datetime.now())
+    created_at = Column(DateTime, server_default=func.now())
+    modified_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
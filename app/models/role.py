@@ -1,15 +1,27 @@
 from models.base import Base
 from models.mixin import IdMixin, TimestampMixin
-from sqlalchemy import Column, ForeignKey, String
+from sqlalchemy import Column, ForeignKey, Integer, Sequence, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
+roles_bit_seq = Sequence("roles_bit_seq", start=0, minvalue=0)
+
 
 class Role(Base, TimestampMixin, IdMixin):
     __tablename__ = "roles"
 
     name = Column(String(255), unique=True, nullable=False)
-    users = relationship("UserRole", back_populates="role", lazy="selectin")
+    # Position of the role in the role mask carried by tokens, never reused.
+    bit = Column(
+        Integer,
+        roles_bit_seq,
+        server_default=roles_bit_seq.next_value(),
+        unique=True,
+        nullable=False,
+    )
+    users = relationship(
+        "UserRole", back_populates="role", lazy="raise", passive_deletes=True
+    )
 
 
 class UserRole(IdMixin, TimestampMixin, Base):
@@ -22,5 +34,5 @@ class UserRole(IdMixin, TimestampMixin, Base):
         UUID(as_uuid=True), ForeignKey("roles.id", ondelete="CASCADE"), nullable=False
     )
 
-    role = relationship("Role", back_populates="users", lazy="selectin")
-    user = relationship("User", back_populates="roles", lazy="selectin")
+    role = relationship("Role", back_populates="users", lazy="raise")
+    user = relationship("User", back_populates="roles", lazy="raise")
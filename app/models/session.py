@@ -14,4 +14,4 @@ class Session(Base, IdMixin, TimestampMixin):
     user_agent = Column(Text, nullable=True)
     user_action = Column(String(100), nullable=False)  # login, logout, refresh
 
-    user = relationship("User", back_populates="sessions", lazy="selectin")
+    user = relationship("User", back_populates="sessions", lazy="raise")
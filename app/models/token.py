@@ -1,15 +1,16 @@
-from datetime import datetime
 from uuid import uuid4
 
 from models.base import Base
 from models.mixin import IdMixin
-from sqlalchemy import Column, DateTime, ForeignKey, Integer
+from sqlalchemy import DDL, Column, DateTime, ForeignKey, Integer, event, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class Token(Base, IdMixin):
     __tablename__ = "tokens"
+    # Old days are dropped as whole partitions, see services.token_partitions.
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     user_id = Column(
         UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False
@@ -20,6 +21,14 @@ class Token(Base, IdMixin):
     access_exp = Column(Integer, nullable=True)
     refresh_exp = Column(Integer, nullable=True)
 
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, primary_key=True, server_default=func.now())
 
-    user = relationship("User", back_populates="tokens", lazy="selectin")
+    user = relationship("User", back_populates="tokens", lazy="raise")
+
+
+# Rows always have a partition to go to, even before any daily one exists.
+event.listen(
+    Token.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS tokens_default PARTITION OF tokens DEFAULT"),
+)
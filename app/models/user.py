@@ -3,7 +3,6 @@ from models.mixin import IdMixin, TimestampMixin
 from pydantic import EmailStr
 from sqlalchemy import Column, String
 from sqlalchemy.orm import relationship
-from werkzeug.security import check_password_hash, generate_password_hash
 
 
 class User(Base, TimestampMixin, IdMixin):
@@ -14,25 +13,41 @@ class User(Base, TimestampMixin, IdMixin):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(255))
 
-    roles = relationship("UserRole", back_populates="user", lazy="selectin")
-
+    # Relationships load nothing by default, queries ask for them with
+    # loader profiles (services.loaders). The database cascades deletes.
+    roles = relationship(
+        "UserRole", back_populates="user", lazy="raise", passive_deletes=True
+    )
     sessions = relationship(
-        "Session", back_populates="user", lazy="selectin", cascade="all, delete-orphan"
+        "Session",
+        back_populates="user",
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     tokens = relationship(
-        "Token", back_populates="user", lazy="selectin", cascade="all, delete-orphan"
+        "Token",
+        back_populates="user",
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     def __init__(
-        self, email: EmailStr, password: str, username: str, full_name: str
+        self,
+        email: EmailStr,
+        username: str,
+        full_name: str,
+        hashed_password: str,
     ) -> None:
+        """
+        Passwords are hashed and checked with the configured policy by
+        core.hashing, never by the model.
+        """
         self.email = email
         self.username = username
         self.full_name = full_name
-        self.hashed_password = generate_password_hash(password)
-
-    def check_password(self, password: str) -> bool:
-        return check_password_hash(self.hashed_password, password)
+        self.hashed_password = hashed_password
 
     def __repr__(self) -> str:
         return f"<User {self.email}>"
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from pydantic import ConfigDict, Field, TypeAdapter
 from schemas.base import OrjsonBaseModel
@@ -31,6 +31,7 @@ class UserData(TypedDict, total=False):
 
     email: str
     user_id: str
+    role_mask: int
     roles: list
 
 
@@ -38,9 +39,29 @@ class Payload(OrjsonBaseModel):
     __pydantic_config__ = ConfigDict(extra="forbid")
 
     user: UserData
+    exp: Optional[int] = None
+    iat: float = 0
+    jti: Optional[str] = None
+    pair_jti: Optional[str] = None
+    refresh: bool = False
 
 
 class TokenPayload(OrjsonBaseModel):
     email: str
     user_id: str
     roles: list
+
+
+class TokenCheck(OrjsonBaseModel):
+    token: str = Field(title="Access token")
+    allow_roles: Optional[list[str]] = Field(None, title="Allowed roles")
+
+
+class TokenCheckBatch(OrjsonBaseModel):
+    tokens: list[TokenCheck]
+
+
+class TokenVerdict(OrjsonBaseModel):
+    active: bool
+    allowed: bool
+    user: Optional[UserData] = None
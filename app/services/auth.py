@@ -1,26 +1,42 @@
-from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 from typing import Optional
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import jwt as jwt_auth
 from core.config import auth_settings
+from core.hashing import password_hasher
+from core.keys import key_ring
 from core.logger import logger
+from core.singleflight import SingleFlight
 from db.pg import get_session
-from db.redis import add_jti_to_blocklist, get_redis, token_in_blocklist
+from db.redis import (
+    add_jti_to_blocklist,
+    get_redis,
+    revoke_refreshed_pair,
+    revoke_user_tokens,
+    tokens_in_blocklist,
+)
+from db.revocation import revocation_replica
+from db.token_cache import token_cache
 from fastapi import Depends
 from models.role import Role, UserRole
 from models.token import Token
 from models.user import User
 
 # from services.user import User
-from pydantic import EmailStr
 from redis.asyncio import Redis
-from schemas.auth import Payload, TwoTokens
+from redis.exceptions import RedisError
+from schemas.auth import Payload, TokenCheck, TokenVerdict, TwoTokens
 from services.database import BaseDb, PostgresqlEngine
-from sqlalchemy import and_, select
+from services.role_registry import role_registry
+from services.session import record_action, update_action
+from services.token import MintedPair, token_minter
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+verifications = SingleFlight("verify_jwt")
+
 
 class AuthService:
     def __init__(self, db: BaseDb, redis: Redis):
@@ -28,198 +44,298 @@ class AuthService:
         self.redis = redis
         self.auth_jwt = jwt_auth
 
-    async def login(self, email, hashed_password) -> Optional[TwoTokens]:
+    async def login(
+        self, email, hashed_password, user_agent: str = "Unknown"
+    ) -> Optional[TwoTokens]:
+        """
+        Check the password and issue a token pair. The user comes with the
+        bits of their roles in one query, and the audit row of the tokens,
+        the session action and a rehashed password are written in one
+        transaction.
+        """
         logger.info(f"Start to login procedure with {email}")
-        user = await self.get_user_by_email(email)
+        result = await self.db.execute(
+            select(
+                User.id,
+                User.email,
+                User.hashed_password,
+                func.array_agg(Role.bit)
+                .filter(Role.bit.isnot(None))
+                .label("role_bits"),
+            )
+            .outerjoin(UserRole, UserRole.user_id == User.id)
+            .outerjoin(Role, Role.id == UserRole.role_id)
+            .where(User.email == email)
+            .group_by(User.id)
+        )
+        user = result.first()
         logger.info(f"User has the following entry in db {user}")
-        if user:
-            if user.check_password(hashed_password):
-                logger.info(f"User {email} provided the correct password")
-                r = await self.db.execute(
-                    select(Role.name).where(UserRole.user_id == user.id).join(UserRole)
-                )
-                user_roles = [role[0] for role in r.fetchall()]
-                logger.info(f"User {email} has roles {user_roles}")
-                user_data = {
-                    "email": user.email,
-                    "user_id": str(user.id),
-                    "roles": [role for role in user_roles],
-                }
-                return await self.create_tokens(user, True, user_data)
-
-        logger.info(f"Failed to login {email}")
-        return None
-
-    async def get_user_by_email(self, email: EmailStr) -> Optional[User]:
-        logger.info(f"Get user by email {email}")
-        user = await self.db.get_by_key("email", email, User)
-        return user
-
-    async def create_tokens(
-        self, user: User, is_exist: bool = True, user_data={}
-    ) -> TwoTokens:
+        if not user or not await password_hasher.verify(
+            user.hashed_password, hashed_password
+        ):
+            logger.info(f"Failed to login {email}")
+            return None
 
-        access_token = await self.create_token(user, user_data, False)
-        logger.info(f"access token is {access_token}")
+        logger.info(f"User {email} provided the correct password")
+        user_data = {
+            "email": user.email,
+            "user_id": str(user.id),
+            "role_mask": role_registry.mask_of(user.role_bits or ()),
+        }
+        pair = token_minter.mint_pair(user_data)
+        logger.info(f"Tokens {pair.access.jti} and {pair.refresh.jti} are minted")
+
+        if password_hasher.needs_rehash(user.hashed_password):
+            logger.info(f"Rehash password of {email}")
+            await self.db.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(hashed_password=await password_hasher.hash(hashed_password))
+            )
+        if auth_settings.token_audit:
+            await self.db.execute(insert(Token).values(**self.token_row(user.id, pair)))
+        await self.db.execute(record_action(user.id, user_agent, "login"))
+        await self.db.commit()
+        return pair.tokens
+
+    async def get_claims(self, creds) -> Optional[Payload]:
+        """
+        Verified payload of the token, None if it is invalid or revoked.
+        """
+        try:
+            return await self.verify_jwt(creds)
+        except Exception as e:
+            logger.info(e)
+            return None
 
-        refresh_token = await self.create_token(user, user_data, True)
-        logger.info(f"refresh token is {refresh_token}")
+    async def allows(self, payload: Payload, allow_roles: list[str] = None) -> bool:
+        logger.info("check roles if allow")
+        if allow_roles:
+            await role_registry.ensure(allow_roles, self.db)
+        return self.has_roles(payload.user, allow_roles)
+
+    @staticmethod
+    def has_roles(user_payload: dict, allow_roles: list[str] = None) -> bool:
+        role_mask = user_payload.get("role_mask")
+        if role_mask is None:
+            # Tokens issued before role masks carry role names.
+            role_mask = role_registry.mask(user_payload.get("roles") or ())
+
+        if not role_mask:
+            logger.info("User has no roles")
+            return False
 
-        if await self.save_token_jti_to_db(user, access_token, refresh_token):
-            logger.info("Tokens jti and exp were save to tokens table in db")
+        if allow_roles:
+            logger.info(f"check if user has permission is {allow_roles}")
+            return bool(role_mask & role_registry.mask(allow_roles))
+        return True
 
-        return TwoTokens(access_token=access_token, refresh_token=refresh_token)
+    @staticmethod
+    def role_names(user_payload: dict) -> list[str]:
+        role_mask = user_payload.get("role_mask")
+        if role_mask is None:
+            return user_payload.get("roles") or []
+        return role_registry.names_for(role_mask)
 
-    async def create_token(
-        self,
-        user: User,
-        user_data={},
-        refresh=False,
-    ):
-        logger.info("Start to create token")
-        logger.info("User data is user_data")
-        expires_time = datetime.now(tz=timezone.utc) + timedelta(
-            seconds=auth_settings.jwt_access_token_expires_in_seconds
+    async def check_access_batch(self, checks: list[TokenCheck]) -> list[TokenVerdict]:
+        logger.info(f"Check access for {len(checks)} tokens")
+        try:
+            verified = await self.verify_jwts([check.token for check in checks])
+        except Exception as e:
+            # As with get_claims, a token that cannot be verified is denied.
+            logger.error(f"Failed to verify tokens: {e}")
+            verified = [None] * len(checks)
+        await role_registry.ensure(
+            {role for check in checks for role in check.allow_roles or ()}, self.db
         )
-        logger.info(f"expires_time is {expires_time}")
-
-        payload = {}
-
-        payload["user"] = user_data
 
-        payload["exp"] = expires_time
-        payload["jti"] = str(uuid4())
-
-        payload["refresh"] = refresh
+        verdicts = []
+        for check, payload in zip(checks, verified):
+            if not payload:
+                verdicts.append(TokenVerdict(active=False, allowed=False))
+                continue
+
+            allowed = True
+            if check.allow_roles:
+                allowed = self.has_roles(payload.user, check.allow_roles)
+            verdicts.append(
+                TokenVerdict(active=True, allowed=allowed, user=payload.user)
+            )
+        return verdicts
 
-        token = jwt_auth.encode(
-            payload=payload,
-            key=auth_settings.authjwt_secret_key,
-            algorithm=auth_settings.authjwt_algorithm,
+    async def verify_jwt(self, jwtoken: str) -> Optional[Payload]:
+        """
+        Verify a token, sharing the verification with concurrent requests
+        of this worker that carry the same token.
+        """
+        logger.info("Start to verify")
+        verified, _ = await verifications.do(
+            token_cache.digest(jwtoken), lambda: self.verify_jwts([jwtoken])
         )
-        logger.info("Token is generated")
-        return token
-
-    async def check_access(self, creds) -> None:
-        logger.info(f"Check access for token {creds}")
-        try:
-            result = (await self.verify_jwt(creds)).user
-            logger.info(f"The result is {result}")
-
-        except Exception as e:
-            logger.info(e)
-            return None
-        return result
-
-    async def check_access_with_roles(
-        self, creds, allow_roles: list[str] = None
-    ) -> None:
-        logger.info(f"check {creds} against {allow_roles}")
-        user_payload = await self.check_access(creds)
-        if user_payload:
-            logger.info("check roles if allow")
-            if not user_payload.get("roles", None):
-                logger.info("User has no roles")
-
-            else:
-                if allow_roles:
-                    logger.info(f"check if user has permission is {allow_roles}")
-                    if not set(allow_roles) & set(user_payload.get("roles", "fake")):
-                        return False
-                return True
-        return False
+        return verified[0]
+
+    async def verify_jwts(self, jwtokens: list[str]) -> list[Optional[Payload]]:
+        """
+        Verify tokens with at most one blocklist round trip for all of them.
+        """
+        # Cached verdicts are only as good as the revocation feed behind them.
+        use_cache = revocation_replica.is_fresh()
+        cache_version = token_cache.version
+        verified: list[Optional[Payload]] = [None] * len(jwtokens)
+        decoded: dict[int, dict] = {}
+
+        for i, jwtoken in enumerate(jwtokens):
+            cached = token_cache.get(jwtoken) if use_cache else None
+            if cached:
+                # Cached entries are dropped on jti revocation, not on a
+                # not-before epoch, so that one is checked on every hit.
+                if not revocation_replica.is_revoked(
+                    cached.jti, cached.user.get("user_id"), cached.iat
+                ):
+                    logger.info("Token is verified from cache")
+                    verified[i] = cached
+                continue
 
-    async def verify_jwt(self, jwtoken: str) -> bool:
-        logger.info("Start to verify")
-        try:
             logger.info("Start to get payload from decode_jwt")
             payload = await self.decode_jwt(jwtoken)
             logger.info(f"Get payload from decode_jwt {payload}")
-        except:  # noqa
-            return None
+            if payload and "jti" in payload:
+                decoded[i] = payload
 
-        if await token_in_blocklist(payload["jti"]):
-            logger.info(f"Token {payload['jti']} is in blacklist")
-            return None
-        logger.info(f"Payload is {payload}")
-        return Payload(**payload)
+        if not decoded:
+            return verified
+
+        revoked = await tokens_in_blocklist(
+            [
+                (payload["jti"], payload["user"].get("user_id"), payload.get("iat", 0))
+                for payload in decoded.values()
+            ]
+        )
+        for (i, payload), is_revoked in zip(decoded.items(), revoked):
+            if is_revoked:
+                logger.info(f"Token {payload['jti']} is in blacklist")
+                continue
+
+            verified[i] = Payload(**payload)
+            if use_cache:
+                token_cache.set(
+                    jwtokens[i],
+                    verified[i],
+                    payload["jti"],
+                    payload["exp"],
+                    cache_version,
+                )
+        return verified
 
     async def decode_jwt(self, token: str) -> dict:
         logger.info("Start to decode")
         try:
-            decoded_token = self.auth_jwt.decode(
-                token,
-                key=auth_settings.authjwt_secret_key,
-                algorithms=auth_settings.authjwt_algorithm,
-            )
+            kid = self.auth_jwt.get_unverified_header(token).get("kid")
+            key, algorithms = key_ring.verification_key(kid)
+            decoded_token = self.auth_jwt.decode(token, key=key, algorithms=algorithms)
             logger.info(f"decoded token is {decoded_token}")
             return decoded_token
         except Exception as e:
             logger.error(e)
             return False
 
-    async def logout(self, access_token: str) -> None:
-        logger.info(f"Logout user {access_token}")
-        decoded_token = await self.decode_jwt(access_token)
-        if not decoded_token:
-            return False
+    async def logout_everywhere(self, user_id: str) -> None:
+        """
+        Revoke every token of the user at once: access and refresh tokens
+        issued before now fail verification on every worker.
+        """
+        logger.info(f"Logout user {user_id} everywhere")
+        await revoke_user_tokens(user_id)
+
+    async def logout(self, claims: Payload) -> None:
+        logger.info(f"Logout user {claims.user}")
         logger.info("End session token")
-        await self.end_session(decoded_token["jti"], decoded_token["user"]["user_id"])
+        await self.end_session(claims)
 
-    async def end_session(self, jti: str, user_id: str):
-        logger.info(f"End session for {jti}")
+    async def end_session(self, claims: Payload) -> None:
+        """
+        Revoke the token and the other token of its pair, known from the
+        pair_jti claim without a query.
+        """
+        logger.info(f"End session for {claims.jti}")
 
-        opposite_jti = await self.get_opposite_token(user_id, jti)
+        pair_jti = claims.pair_jti
+        if not pair_jti:
+            pair_jti = await self.get_opposite_token(claims.user["user_id"], claims.jti)
 
-        logger.info(f"opposite jti is {opposite_jti}")
-        if opposite_jti:
-            await self.revoke_token(jti)
-            await self.revoke_token(opposite_jti)
+        logger.info(f"opposite jti is {pair_jti}")
+        await add_jti_to_blocklist(*filter(None, (claims.jti, pair_jti)))
 
     async def revoke_token(self, jti: UUID):
         await add_jti_to_blocklist(str(jti))
 
-    async def get_opposite_token(self, user_id, jti):
+    async def get_opposite_token(self, user_id, jti) -> Optional[str]:
+        """
+        The other jti of the pair from the tokens table, for tokens minted
+        before they carried pair_jti.
+        """
         logger.info(f"To find opposite jti user_id: {user_id}, jti: {jti}")
 
-        query = select(Token.refresh_jti).where(
-            and_(Token.user_id == user_id, Token.access_jti == jti)
+        query = select(Token.access_jti, Token.refresh_jti).where(
+            and_(
+                Token.user_id == user_id,
+                or_(Token.access_jti == jti, Token.refresh_jti == jti),
+            )
         )
-        result = await self.db.execute(query)
-        jti_to_add = result.scalars().first()
+        row = (await self.db.execute(query)).first()
+        if not row:
+            return None
 
-        if jti_to_add:
-            logger.info(f"Got opposite jti: {jti_to_add}")
-            return jti_to_add
+        opposite = row.refresh_jti if str(row.access_jti) == jti else row.access_jti
+        logger.info(f"Got opposite jti: {opposite}")
+        return str(opposite)
+
+    async def rotate_tokens(
+        self, refresh_token: str, user_agent: str = "Unknown"
+    ) -> Optional[TwoTokens]:
+        """
+        Exchange a refresh token for a new pair. The audit row of the new
+        pair and the refresh action are written in one statement; the old
+        pair is checked and revoked in one Redis call before the transaction
+        commits.
+        """
+        logger.info("From auth service start to refresh token")
+        payload = await self.decode_jwt(refresh_token)
+        if not payload or not payload.get("refresh") or "jti" not in payload:
+            return None
 
-        else:
-            query = select(Token.access_jti).where(
-                and_(Token.user_id == user_id, Token.refresh_jti == jti)
+        claims = Payload(**payload)
+        user_id = claims.user["user_id"]
+        pair = token_minter.mint_pair(claims.user)
+        logger.info(f"Tokens {pair.access.jti} and {pair.refresh.jti} are minted")
+
+        if auth_settings.token_audit:
+            # A user deleted since the token was issued fails the foreign key.
+            statement = (
+                insert(Token)
+                .values(**self.token_row(user_id, pair))
+                .returning(Token.user_id)
             )
-            result = await self.db.execute(query)
-            jti_to_add = result.scalars().first()
-
-            if jti_to_add:
-                logger.info(f"Got opposite jti: {jti_to_add}")
-                return jti_to_add
-
-        return False
-
-    async def refresh_tokens(self, refresh_token: str) -> Optional[TwoTokens]:
-        logger.info("From auth service start to refresh token")
-        decoded_token = await self.decode_jwt(refresh_token)
-        if decoded_token:
-            logger.info(f"decoded refresh token: {decoded_token}")
-            logger.info("End session token")
-            await self.end_session(
-                decoded_token["jti"], decoded_token["user"]["user_id"]
+        else:
+            statement = select(User.id).where(User.id == user_id)
+        statement = statement.add_cte(
+            update_action(user_id, user_agent, "refresh").cte("refreshed")
+        )
+        try:
+            pair_jti = claims.pair_jti or await self.get_opposite_token(
+                user_id, claims.jti
             )
-            user = await self.get_user_by_email(decoded_token["user"]["email"])
-            logger.info(f"get user to refresh: {user}")
-            if user:
-                if decoded_token["refresh"]:
-                    return await self.create_tokens(user, True, decoded_token["user"])
-        return False
+            if (await self.db.execute(statement)).first() and (
+                await revoke_refreshed_pair(claims.jti, pair_jti, user_id, claims.iat)
+            ):
+                await self.db.commit()
+                return pair.tokens
+        except (IntegrityError, RedisError) as e:
+            logger.info(f"Failed to refresh tokens: {e}")
+
+        logger.info(f"Refresh token {claims.jti} is revoked")
+        await self.db.rollback()
+        return None
 
     async def is_token_in_redis(self, refresh_token: str) -> bool:
         decoded_token = await self.decode_jwt(refresh_token)
@@ -227,25 +343,15 @@ class AuthService:
             return True
         return False
 
-    async def save_token_jti_to_db(
-        self, user: User, access_token: str, refresh_token: str
-    ) -> bool:
-        decoded_access = await self.decode_jwt(access_token)
-        decoded_refresh = await self.decode_jwt(refresh_token)
-        access_jti = decoded_access["jti"]
-        access_exp = decoded_access["exp"]
-        refresh_jti = decoded_refresh["jti"]
-        refresh_exp = decoded_refresh["exp"]
-        token = Token(
-            user_id=user.id,
-            access_jti=access_jti,
-            access_exp=access_exp,
-            refresh_jti=refresh_jti,
-            refresh_exp=refresh_exp,
-        )
-
-        await self.db.create(token, Token)
-        return True
+    @staticmethod
+    def token_row(user_id: UUID, pair: MintedPair) -> dict:
+        return {
+            "user_id": user_id,
+            "access_jti": pair.access.jti,
+            "access_exp": pair.access.exp,
+            "refresh_jti": pair.refresh.jti,
+            "refresh_exp": pair.refresh.exp,
+        }
 
 
 @lru_cache()
@@ -1,17 +1,44 @@
 from abc import ABC, abstractmethod
-from typing import Any, List, Optional
+from itertools import islice
+from typing import Any, Hashable, Iterable, List, Optional
 from uuid import UUID
 
+from core.singleflight import SingleFlight
 from models.base import Base
-from sqlalchemy import select
+from services.loaders import loader_options
+from sqlalchemy import any_, column, delete, insert, literal, select, update, values
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+lookups = SingleFlight("db")
+
+# asyncpg takes at most 32767 parameters per statement.
+MAX_PARAMETERS = 32767
+
+
+def as_dict(object_data: Any) -> dict:
+    if hasattr(object_data, "dict"):
+        return object_data.dict(exclude_unset=True)
+    return object_data
+
+
+def any_id(id_column: Any, object_ids: Iterable[UUID]):
+    """
+    id = ANY(:ids), with all the ids in a single array parameter.
+    """
+    return id_column == any_(literal(list(object_ids), ARRAY(id_column.type)))
+
 
 class AsyncDbEngine(ABC):
     @abstractmethod
     async def get_by_id(self, object_id: UUID, Object: Any) -> Optional[Any]:
         pass
 
+    @abstractmethod
+    async def first_shared(self, key: Hashable, query) -> Optional[Any]:
+        pass
+
     @abstractmethod
     async def create(self, object_data: Any) -> Any:
         pass
@@ -21,13 +48,45 @@ class AsyncDbEngine(ABC):
         pass
 
     @abstractmethod
-    async def delete(self, object_id: UUID) -> None:
+    async def delete(self, object_id: UUID) -> bool:
         pass
 
     @abstractmethod
     async def list_all(self, Object: Any) -> List[Any]:
         pass
 
+    @abstractmethod
+    async def create_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[Any]:
+        pass
+
+    @abstractmethod
+    async def get_many_by_ids(
+        self, object_ids: List[UUID], Object: Any, options: tuple = ()
+    ) -> List[Any]:
+        pass
+
+    @abstractmethod
+    async def update_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        pass
+
+    @abstractmethod
+    async def delete_many(
+        self, object_ids: List[UUID], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        pass
+
+    @abstractmethod
+    async def commit(self) -> None:
+        pass
+
+    @abstractmethod
+    async def rollback(self) -> None:
+        pass
+
 
 class PostgresqlEngine(AsyncDbEngine):
     def __init__(self, db_session: AsyncSession):
@@ -38,53 +97,187 @@ class PostgresqlEngine(AsyncDbEngine):
         result = await self.db_session.execute(query)
         return result.scalar_one_or_none()
 
+    async def first(self, query) -> Optional[Any]:
+        result = await self.db_session.execute(query)
+        return result.scalars().first()
+
+    async def first_shared(self, key: Hashable, query) -> Optional[Any]:
+        """
+        First object of the query, with concurrent lookups of the same key
+        in this worker sharing one query. A caller that joins a query in
+        flight gets the object merged into its own session, without a query
+        or a connection of its own.
+        """
+        session = self.db_session
+        if session.in_transaction() or session.new or session.dirty or session.deleted:
+            # The caller's own writes, flushed, sent as statements or still
+            # pending, are only seen by a query in its own transaction.
+            return await self.first(query)
+
+        obj, shared = await lookups.do(key, lambda: self.first(query))
+        if not shared or obj is None:
+            return obj
+        try:
+            return await session.merge(obj, load=False)
+        except InvalidRequestError:
+            # The caller that ran the query has changed the object since.
+            return await self.first(query)
+
     async def create(self, object_data: Any, Object: Any) -> Any:
         new_object = object_data
         self.db_session.add(new_object)
+        # The INSERT brings back the server defaults with RETURNING.
         await self.db_session.commit()
-        await self.db_session.refresh(new_object)
         return new_object
 
     async def update(
         self, object_id: UUID, object_data: Any, Object: Any
     ) -> Optional[Any]:
-        obj = await self.get_by_id(object_id, Object)
-        if obj:
-            if hasattr(object_data, "dict"):
-                update_data = object_data.dict(exclude_unset=True)
-            else:
-                update_data = object_data
-
-            for key, value in update_data.items():
-                setattr(obj, key, value)
+        """
+        Update the row with one UPDATE ... RETURNING and return the object
+        built from the returned row, None if there is no such row.
+        """
+        update_data = as_dict(object_data)
+        if not update_data:
+            return await self.get_by_id(object_id, Object)
 
+        statement = (
+            update(Object)
+            .where(Object.id == object_id)
+            .values(**update_data)
+            .returning(Object)
+            .execution_options(populate_existing=True)
+        )
+        obj = (await self.db_session.scalars(statement)).one_or_none()
+        if obj:
             await self.db_session.commit()
-            await self.db_session.refresh(obj)
-
         return obj
 
-    async def delete(self, object_id: UUID, Object: Any) -> None:
-        obj = await self.get_by_id(object_id, Object)
-        if obj:
-            await self.db_session.delete(obj)
+    async def delete(self, object_id: UUID, Object: Any) -> bool:
+        """
+        Delete the row with one DELETE ... RETURNING. Whether there was
+        such a row.
+        """
+        statement = delete(Object).where(Object.id == object_id).returning(Object.id)
+        deleted = (await self.db_session.execute(statement)).first() is not None
+        if deleted:
             await self.db_session.commit()
+        return deleted
 
     async def list_all(self, Object: Any) -> List[Any]:
         query = select(Object)
         result = await self.db_session.execute(query)
         return result.scalars().all()
 
+    async def create_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[Any]:
+        """
+        Insert the rows with multi-row INSERT ... RETURNING statements and
+        return the new objects, defaults filled in.
+        """
+        if not objects_data:
+            return []
+        result = await self.db_session.scalars(
+            insert(Object).returning(Object, sort_by_parameter_order=True),
+            [as_dict(data) for data in objects_data],
+        )
+        created = result.all()
+        if commit:
+            await self.db_session.commit()
+        return created
+
+    async def get_many_by_ids(
+        self, object_ids: List[UUID], Object: Any, options: tuple = ()
+    ) -> List[Any]:
+        if not object_ids:
+            return []
+        query = select(Object).where(any_id(Object.id, object_ids)).options(*options)
+        result = await self.db_session.execute(query)
+        return result.scalars().all()
+
+    async def update_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        """
+        Update the rows by id from VALUES lists joined to the table, one
+        statement per as many rows as fit the parameter limit. Every row
+        sets the same columns. Returns the ids of the updated rows.
+
+        Objects of these rows already in the session keep their old state.
+        """
+        rows = [as_dict(data) for data in objects_data]
+        if not rows:
+            return []
+        names = list(rows[0])
+        if "id" not in names or any(row.keys() != rows[0].keys() for row in rows):
+            raise ValueError("Every row has to set id and the same columns")
+
+        table = Object.__table__
+        columns = [column(name, table.c[name].type) for name in names]
+        chunks = iter(rows)
+        # onupdate columns take a parameter of their own.
+        size = (MAX_PARAMETERS - len(table.c)) // len(names)
+        updated = []
+        for chunk in iter(lambda: list(islice(chunks, size)), []):
+            data = values(*columns, name="data").data(
+                [tuple(row[name] for name in names) for row in chunk]
+            )
+            statement = (
+                update(table)
+                .where(table.c.id == data.c.id)
+                .values({name: data.c[name] for name in names if name != "id"})
+                .returning(table.c.id)
+            )
+            updated += (await self.db_session.execute(statement)).scalars().all()
+        if commit:
+            await self.db_session.commit()
+        return updated
+
+    async def delete_many(
+        self, object_ids: List[UUID], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        """
+        Delete the rows in one statement and return the ids of the deleted
+        ones.
+        """
+        if not object_ids:
+            return []
+        table = Object.__table__
+        statement = (
+            delete(table).where(any_id(table.c.id, object_ids)).returning(table.c.id)
+        )
+        deleted = (await self.db_session.execute(statement)).scalars().all()
+        if commit:
+            await self.db_session.commit()
+        return deleted
+
     async def execute(self, query) -> Any:
         result = await self.db_session.execute(query)
         return result
 
+    async def commit(self) -> None:
+        await self.db_session.commit()
+
+    async def rollback(self) -> None:
+        await self.db_session.rollback()
+
 
 class BaseDb:
     def __init__(self, db_engine: AsyncDbEngine):
         self.db_engine = db_engine
 
-    async def get_by_id(self, object_id: UUID, Object: Any) -> Optional[Any]:
-        return await self.db_engine.get_by_id(object_id, Object)
+    async def get_by_id(
+        self, object_id: UUID, Object: Any, profile: Optional[str] = None
+    ) -> Optional[Any]:
+        query = (
+            select(Object)
+            .where(Object.id == object_id)
+            .options(*loader_options(Object, profile))
+        )
+        return await self.db_engine.first_shared(
+            (Object, "id", object_id, profile), query
+        )
 
     async def create(self, object_data: Any, Object: Any) -> Any:
         return await self.db_engine.create(object_data, Object)
@@ -94,16 +287,49 @@ class BaseDb:
     ) -> Optional[Any]:
         return await self.db_engine.update(object_id, object_data, Object)
 
-    async def delete(self, object_id: UUID, Object: Any) -> None:
-        await self.db_engine.delete(object_id, Object)
+    async def delete(self, object_id: UUID, Object: Any) -> bool:
+        return await self.db_engine.delete(object_id, Object)
 
     async def list_all(self, Object: Any) -> List[Any]:
         return await self.db_engine.list_all(Object)
 
-    async def get_by_key(self, key: str, value: Any, Object: Any) -> Optional[Any]:
-        query = select(Object).where(getattr(Object, key) == value)
-        result = await self.db_engine.execute(query)
-        return result.scalars().first()
+    async def get_by_key(
+        self, key: str, value: Any, Object: Any, profile: Optional[str] = None
+    ) -> Optional[Any]:
+        query = (
+            select(Object)
+            .where(getattr(Object, key) == value)
+            .options(*loader_options(Object, profile))
+        )
+        return await self.db_engine.first_shared((Object, key, value, profile), query)
+
+    async def create_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[Any]:
+        return await self.db_engine.create_many(objects_data, Object, commit)
+
+    async def get_many_by_ids(
+        self, object_ids: List[UUID], Object: Any, profile: Optional[str] = None
+    ) -> List[Any]:
+        return await self.db_engine.get_many_by_ids(
+            object_ids, Object, loader_options(Object, profile)
+        )
+
+    async def update_many(
+        self, objects_data: List[Any], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        return await self.db_engine.update_many(objects_data, Object, commit)
+
+    async def delete_many(
+        self, object_ids: List[UUID], Object: Any, commit: bool = True
+    ) -> List[UUID]:
+        return await self.db_engine.delete_many(object_ids, Object, commit)
 
     async def execute(self, query) -> Any:
         return await self.db_engine.execute(query)
+
+    async def commit(self) -> None:
+        await self.db_engine.commit()
+
+    async def rollback(self) -> None:
+        await self.db_engine.rollback()
@@ -0,0 +1,26 @@
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from models.role import UserRole
+from models.user import User
+from sqlalchemy.orm import selectinload
+
+# What a lookup loads together with the object, by profile. Relationships
+# load nothing by default, so each service method names the profile it
+# needs instead of every query loading the whole object graph. Options
+# are built on first use, once every model is mapped.
+PROFILES: dict[Any, dict[str, Callable[[], tuple]]] = {
+    User: {
+        # Login and token checks: the user's own columns.
+        "auth": lambda: (),
+        # The user with their roles.
+        "profile": lambda: (selectinload(User.roles).joinedload(UserRole.role),),
+    },
+}
+
+
+@lru_cache()
+def loader_options(Object: Any, profile: Optional[str]) -> tuple:
+    if profile is None:
+        return ()
+    return PROFILES[Object][profile]()
@@ -7,6 +7,7 @@ from fastapi import Depends
 from models.role import Role
 from schemas.role import RoleBase, RoleResponse
 from services.database import BaseDb, PostgresqlEngine
+from services.role_registry import role_registry
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -21,6 +22,7 @@ class RoleService:
     async def create_role(self, role_data: RoleBase) -> RoleResponse:
         new_role = Role(**role_data.dict())
         created_role = await self.db.create(new_role, Role)
+        await role_registry.refresh(self.db)
         return RoleResponse.from_orm(created_role)
 
     async def get_role_by_id(self, role_id: UUID) -> Optional[RoleResponse]:
@@ -29,14 +31,18 @@ class RoleService:
             return RoleResponse.from_orm(role)
         return None
 
-    async def delete_role(self, role_id: UUID) -> None:
-        await self.db.delete(role_id, Role)
+    async def delete_role(self, role_id: UUID) -> bool:
+        if not await self.db.delete(role_id, Role):
+            return False
+        await role_registry.refresh(self.db)
+        return True
 
     async def update_role(
         self, role_id: UUID, role_data: RoleBase
     ) -> Optional[RoleResponse]:
         updated_role = await self.db.update(role_id, role_data, Role)
         if updated_role:
+            await role_registry.refresh(self.db)
             return RoleResponse.from_orm(updated_role)
         return None
 
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Iterable, Optional
+
+from core.config import auth_settings
+from core.logger import logger
+from core.singleflight import SingleFlight
+from db.pg import async_session
+from models.role import Role
+from services.database import BaseDb, PostgresqlEngine
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+
+class RoleRegistry:
+    """
+    Maps role names to the stable bit each role owns in a token's role mask.
+
+    Masks for a set of role names are compiled once and reused until the
+    registry changes, so a role check is a single bitwise AND.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.bits: dict[str, int] = {}
+        self.names: dict[int, str] = {}
+        self.loaded_at: Optional[float] = None
+        self._masks: dict[tuple, int] = {}
+        self._reloads = SingleFlight("role_registry")
+
+    @staticmethod
+    def mask_of(bits: Iterable[int]) -> int:
+        mask = 0
+        for bit in bits:
+            mask |= 1 << bit
+        return mask
+
+    def load(self, rows: Iterable[tuple[str, int]]) -> None:
+        self.bits = {name: bit for name, bit in rows}
+        self.names = {bit: name for name, bit in self.bits.items()}
+        self._masks = {}
+        self.loaded_at = time.monotonic()
+
+    async def refresh(self, db: BaseDb) -> None:
+        result = await db.execute(select(Role.name, Role.bit))
+        self.load(result.fetchall())
+        logger.info(f"Role registry has {len(self.bits)} roles")
+
+    async def ensure(self, names: Iterable[str], db: BaseDb) -> None:
+        """
+        Reload the registry if it does not know some of the names yet,
+        e.g. a role was created by another worker. Concurrent callers
+        share one reload.
+        """
+        if all(name in self.bits for name in names):
+            return
+        if (
+            self.loaded_at is not None
+            and time.monotonic() - self.loaded_at < self.refresh_interval
+        ):
+            return
+        await self._reloads.do("roles", lambda: self.refresh(db))
+
+    def mask(self, names: Iterable[str]) -> int:
+        key = names if isinstance(names, tuple) else tuple(names)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self.mask_of(self.bits[name] for name in key if name in self.bits)
+            self._masks[key] = mask
+        return mask
+
+    def names_for(self, mask: int) -> list[str]:
+        return [name for bit, name in self.names.items() if mask >> bit & 1]
+
+
+role_registry = RoleRegistry(
+    refresh_interval=auth_settings.role_registry_refresh_seconds
+)
+
+
+async def refresh_role_registry() -> None:
+    """
+    Keep the registry in line with roles changed by other workers.
+    """
+    while True:
+        try:
+            async with async_session() as session:
+                await role_registry.refresh(BaseDb(PostgresqlEngine(session)))
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Failed to load role registry: {e}")
+        await asyncio.sleep(role_registry.refresh_interval)
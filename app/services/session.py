@@ -8,6 +8,7 @@ from fastapi import Depends
 from models.session import Session
 from schemas.session import SessionCreate, SessionResponse, SessionUpdate
 from services.database import BaseDb, PostgresqlEngine
+from sqlalchemy import Insert, Update, exists, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
@@ -56,8 +57,48 @@ class SessionService:
     ) -> Optional[Session]:
         return await self.db.update(session_id, session_data.dict(), Session)
 
-    async def delete_session(self, session_id: UUID) -> None:
-        await self.db.delete(session_id, Session)
+    async def delete_session(self, session_id: UUID) -> bool:
+        return await self.db.delete(session_id, Session)
+
+
+def update_action(user_id: UUID, user_agent: str, user_action: str) -> Update:
+    """
+    Statement that stores the action on the user's session for the user
+    agent, if there is one.
+    """
+    return (
+        update(Session)
+        .where(
+            Session.id
+            == select(Session.id)
+            .where(Session.user_id == user_id, Session.user_agent == user_agent)
+            .limit(1)
+            .scalar_subquery()
+        )
+        .values(user_action=user_action)
+    )
+
+
+def record_action(user_id: UUID, user_agent: str, user_action: str) -> Insert:
+    """
+    Single statement that stores the action on the user's session for the
+    user agent, creating the session if there is none yet.
+    """
+    updated = (
+        update_action(user_id, user_agent, user_action)
+        .returning(Session.id)
+        .cte("updated")
+    )
+    created = select(
+        literal(user_id, Session.user_id.type),
+        literal(user_agent, Session.user_agent.type),
+        literal(user_action, Session.user_action.type),
+    ).where(~exists(select(updated.c.id)))
+    return (
+        insert(Session)
+        .from_select(["user_id", "user_agent", "user_action"], created)
+        .add_cte(updated)
+    )
 
 
 @lru_cache()
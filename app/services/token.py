@@ -0,0 +1,70 @@
+import time
+from typing import NamedTuple
+from uuid import uuid4
+
+import jwt
+from core.config import auth_settings
+from core.keys import KeyRing, key_ring
+from db.revocation import millis
+from schemas.auth import TwoTokens
+
+
+class MintedToken(NamedTuple):
+    token: str
+    jti: str
+    exp: int
+
+
+class MintedPair(NamedTuple):
+    access: MintedToken
+    refresh: MintedToken
+
+    @property
+    def tokens(self) -> TwoTokens:
+        return TwoTokens(
+            access_token=self.access.token, refresh_token=self.refresh.token
+        )
+
+
+class TokenMinter:
+    """
+    Builds the claims of a token pair once and returns the encoded tokens
+    together with the jti and exp they carry, so nothing has to be decoded
+    back to persist them.
+    """
+
+    def __init__(self, key_ring: KeyRing, expires_in: int):
+        self.key_ring = key_ring
+        self.expires_in = expires_in
+
+    def mint(self, claims: dict, refresh: bool, jti: str, pair_jti: str) -> MintedToken:
+        token = jwt.encode(
+            payload={**claims, "jti": jti, "pair_jti": pair_jti, "refresh": refresh},
+            key=self.key_ring.signing_key,
+            algorithm=self.key_ring.signing_algorithm,
+            headers=self.key_ring.headers,
+        )
+        return MintedToken(token, jti, claims["exp"])
+
+    def mint_pair(self, user_data: dict) -> MintedPair:
+        """
+        Each token of the pair carries the jti of the other one as pair_jti,
+        so the pair can be revoked from either token alone. iat has a
+        millisecond resolution to be compared with not-before epochs.
+        """
+        now = time.time()
+        claims = {
+            "user": user_data,
+            "iat": millis(now) / 1000,
+            "exp": int(now) + self.expires_in,
+        }
+        access_jti, refresh_jti = str(uuid4()), str(uuid4())
+        return MintedPair(
+            self.mint(claims, False, access_jti, refresh_jti),
+            self.mint(claims, True, refresh_jti, access_jti),
+        )
+
+
+token_minter = TokenMinter(
+    key_ring, expires_in=auth_settings.jwt_access_token_expires_in_seconds
+)
@@ -0,0 +1,134 @@
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from core.config import auth_settings
+from core.logger import logger
+from db.pg import async_session
+from services.database import BaseDb, PostgresqlEngine
+from services.token import token_minter
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+# tokens is range partitioned by created_at: a partition per day named
+# after it, the rows from before partitioning in tokens_legacy and a
+# default partition that only fills up if maintenance falls behind.
+DAILY = re.compile(r"tokens_(\d{8})")
+LEGACY = "tokens_legacy"
+DEFAULT = "tokens_default"
+LOCK = "tokens_partitions"
+
+PARTITIONS = text(
+    """
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'tokens'::regclass
+    """
+)
+UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+TRY_LOCK = text("SELECT pg_try_advisory_xact_lock(hashtext(:lock))")
+
+
+def partition_name(day: date) -> str:
+    return f"tokens_{day:%Y%m%d}"
+
+
+def upper_bound(bound: str) -> Optional[datetime]:
+    """
+    End of the created_at range of a partition, from its bound expression.
+    None for the default partition.
+    """
+    match = UPPER_BOUND.search(bound)
+    return datetime.fromisoformat(match.group(1)) if match else None
+
+
+async def run_locked(db: BaseDb, statement: str) -> bool:
+    """
+    Run a DDL statement in a transaction of its own under the advisory
+    lock, so the lock it takes on tokens is held only for the statement
+    itself. False if another worker holds the advisory lock.
+    """
+    if not (await db.execute(TRY_LOCK.bindparams(lock=LOCK))).scalar():
+        await db.rollback()
+        return False
+    await db.execute(text(statement))
+    await db.commit()
+    return True
+
+
+async def maintain_token_partitions(
+    db: BaseDb, today: date, ahead: int
+) -> tuple[list[str], list[str]]:
+    """
+    Create the daily partitions of tokens up to ahead days from today and
+    drop the partitions whose refresh tokens have all expired. Returns the
+    created and the dropped partitions.
+
+    A partition is expired once the refresh token lifetime has passed since
+    the end of its created_at range, so nothing is scanned. Every create and
+    drop commits on its own: they lock tokens and block inserts while they
+    run. They are made under an advisory lock, so workers doing it at the
+    same time do not collide: the ones that do not get the lock stop.
+    """
+    bounds = dict((await db.execute(PARTITIONS)).all())
+    await db.rollback()
+    created, dropped = [], []
+
+    for offset in range(ahead + 1):
+        day = today + timedelta(days=offset)
+        name = partition_name(day)
+        if name in bounds:
+            continue
+        end = day + timedelta(days=1)
+        stray = text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT} "
+            "WHERE created_at >= :start AND created_at < :end)"
+        )
+        found = (await db.execute(stray.bindparams(start=day, end=end))).scalar()
+        await db.rollback()
+        if found:
+            # Postgres refuses a partition for rows already in the default one.
+            logger.warning(f"Rows of {day} are in {DEFAULT}, {name} is not created")
+            continue
+        statement = (
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF tokens "
+            f"FOR VALUES FROM ('{day}') TO ('{end}')"
+        )
+        if not await run_locked(db, statement):
+            return created, dropped
+        created.append(name)
+
+    expired_before = datetime.now() - timedelta(seconds=token_minter.expires_in)
+    for name, bound in sorted(bounds.items()):
+        if name != LEGACY and not DAILY.fullmatch(name):
+            continue
+        end = upper_bound(bound)
+        if end is None or end > expired_before:
+            continue
+        if not await run_locked(db, f"DROP TABLE IF EXISTS {name}"):
+            break
+        dropped.append(name)
+
+    if created or dropped:
+        logger.info(f"Token partitions created: {created}, dropped: {dropped}")
+    return created, dropped
+
+
+async def run_token_partition_maintenance() -> None:
+    """
+    Keep partitions of tokens ahead of time and retention constant time:
+    expired days are dropped as a whole instead of deleted row by row.
+    """
+    while True:
+        try:
+            async with async_session() as session:
+                await maintain_token_partitions(
+                    BaseDb(PostgresqlEngine(session)),
+                    datetime.now().date(),
+                    auth_settings.token_partitions_ahead_days,
+                )
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Failed to maintain token partitions: {e}")
+        await asyncio.sleep(auth_settings.token_partition_maintenance_seconds)
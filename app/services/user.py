@@ -3,45 +3,59 @@ from functools import lru_cache
 from typing import Optional
 from uuid import UUID
 
+from core.hashing import password_hasher
 from db.pg import get_session
+from db.redis import revoke_user_tokens
 from fastapi import Depends
 from fastapi.encoders import jsonable_encoder
 from models.role import Role, UserRole
 from models.user import User
-from pydantic import EmailStr
-from schemas.user import UserCreate, UserPatch, UserResponse, UserResponseLogin
+from schemas.user import UserCreate, UserPatch, UserResponse
 from services.database import BaseDb, PostgresqlEngine
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
+TAKEN = {
+    "users_email_key": "The email is already in use",
+    "users_username_key": "The username is already in use",
+}
+
 
 class UserService:
     def __init__(self, db: BaseDb):
         self.db = db
 
-    async def get_user_by_email(self, email: EmailStr) -> Optional[UserResponse]:
-        logger.info(f"Checking if user with email {email} exists")
-        user = await self.db.get_by_key("email", email, User)
-        if user:
-            return UserResponseLogin.from_orm(user)
-        return None
-
-    async def get_user_by_username(self, username: str) -> Optional[UserResponse]:
-        logger.info(f"Checking if user with username {username} exists")
-        user = await self.db.get_by_key("username", username, User)
-        if user:
-            return UserResponse.from_orm(user)
-        return None
-
     async def create_user(self, user_create: UserCreate) -> UserResponse:
-        user = User(**user_create.dict())
+        """
+        Insert the user in one statement; the unique constraints, not a
+        lookup beforehand, tell whether the email or username is taken.
+        """
+        hashed_password = await password_hasher.hash(user_create.password)
         logger.info(f"Creating a new user with data: {user_create}")
-        new_user = await self.db.create(user, User)
+        try:
+            result = await self.db.execute(
+                insert(User)
+                .values(
+                    **user_create.dict(exclude={"password"}),
+                    hashed_password=hashed_password,
+                )
+                .returning(User.id, User.email, User.username, User.full_name)
+            )
+            new_user = result.one()
+            await self.db.commit()
+        except IntegrityError as e:
+            await self.db.rollback()
+            constraint = getattr(e.orig.__cause__, "constraint_name", None)
+            if constraint in TAKEN:
+                raise ValueError(TAKEN[constraint])
+            raise
         return UserResponse.from_orm(new_user)
 
     async def get_current_user(self, user_id: UUID) -> Optional[UserResponse]:
-        user = await self.db.get_by_id(user_id, User)
+        user = await self.db.get_by_id(user_id, User, "auth")
         if user:
             return UserResponse.from_orm(user)
         return None
@@ -49,19 +63,23 @@ class UserService:
     async def update_user(
         self, user_id: UUID, user_patch: UserPatch
     ) -> Optional[UserResponse]:
-        current_user = await self.db.get_by_id(user_id, User)
-
-        if not current_user:
-            raise ValueError("User not found")
-
         user_data = jsonable_encoder(user_patch, exclude_unset=True)
+        if "password" in user_data:
+            user_data["hashed_password"] = await password_hasher.hash(
+                user_data.pop("password")
+            )
 
         updated_user = await self.db.update(user_id, user_data, User)
-        if updated_user:
-            return UserResponse.from_orm(updated_user)
+        if not updated_user:
+            raise ValueError("User not found")
+
+        if "hashed_password" in user_data:
+            # Sessions opened with the old password must not survive it.
+            await revoke_user_tokens(str(user_id))
+        return UserResponse.from_orm(updated_user)
 
-    async def delete_user(self, user_id: UUID) -> None:
-        await self.db.delete(user_id, User)
+    async def delete_user(self, user_id: UUID) -> bool:
+        return await self.db.delete(user_id, User)
 
     async def add_role_to_user(self, user_id: UUID, role_id: UUID) -> str:
         user = await self.db.get_by_id(user_id, User)
@@ -79,7 +97,7 @@ class UserService:
         return f"Role {role_id} assigned succesfully to User {user_id}"
 
     async def remove_role_from_user(self, user_id: UUID, role_id: UUID) -> str:
-        user = await self.db.get_by_id(user_id, User)
+        user = await self.db.get_by_id(user_id, User, "profile")
         if not user:
             raise ValueError("User not found")
 
@@ -87,11 +105,16 @@ class UserService:
         if not role:
             raise ValueError("Role not found")
 
-        user_role = await self.db.get_by_key("user_id", user.id, UserRole)
-        if not user_role or user_role.role_id != role.id:
+        user_role = next(
+            (user_role for user_role in user.roles if user_role.role_id == role.id),
+            None,
+        )
+        if not user_role:
             raise ValueError("UserRole association not found")
 
         await self.db.delete(user_role.id, UserRole)
+        # Tokens carry the roles they were issued with.
+        await revoke_user_tokens(str(user_id))
 
         return f"Role {role_id} removed succesfully from User {user_id}"
 
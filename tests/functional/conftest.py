@@ -3,4 +3,5 @@ pytest_plugins = [
     "fixtures.pg",
     "fixtures.redis",
     "fixtures.entity",
+    "fixtures.app",
 ]
@@ -0,0 +1,44 @@
+import io
+import tarfile
+
+import docker
+import pytest
+
+
+class AppContainer:
+    """
+    The running app container, to run its CLI and code that HTTP does not
+    reach against the same database and Redis as the app.
+    """
+
+    def __init__(self, container):
+        self.container = container
+
+    def run(self, *command: str) -> str:
+        exit_code, output = self.container.exec_run(list(command))
+        output = output.decode()
+        assert exit_code == 0, output
+        return output
+
+    def python(self, code: str) -> str:
+        return self.run("python", "-c", code)
+
+    def put_file(self, path: str, content: str) -> None:
+        data = content.encode()
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            info = tarfile.TarInfo(path.rsplit("/", 1)[-1])
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        self.container.put_archive(path.rsplit("/", 1)[0] or "/", archive.getvalue())
+
+
+@pytest.fixture(scope="session")
+def app_container():
+    client = docker.from_env()
+    containers = client.containers.list(
+        filters={"label": "com.docker.compose.service=app"}
+    )
+    assert containers, "The app container is not running"
+    yield AppContainer(containers[0])
+    client.close()
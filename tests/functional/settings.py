@@ -30,6 +30,7 @@ class TestSettings(BaseSettings):
     jwt_refresh_token_expires_in_days: int = 30
 
     app_dsn: str = "http://app:8000"
+    nginx_dsn: str = "http://nginx_test"
 
     @property
     def redis_dsn(self):
@@ -1,7 +1,12 @@
+import asyncio
 import http
+import time
+from uuid import uuid4
 
 import pytest
 from faker import Faker
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
 
 from tests.functional.settings import test_settings
 
@@ -33,6 +38,19 @@ url_check_access_admin = url_template.format(
 url_check_access_user = url_template.format(
     service_url=test_settings.app_dsn, endpoint="check_access?allow_roles=user"
 )
+url_check_access_batch = url_template.format(
+    service_url=test_settings.app_dsn, endpoint="check_access/batch"
+)
+url_logout_all = url_template.format(
+    service_url=test_settings.app_dsn, endpoint="logout_all"
+)
+url_authorize = url_template.format(
+    service_url=test_settings.app_dsn, endpoint="authorize"
+)
+url_nginx_any = f"{test_settings.nginx_dsn}/_test/any"
+url_nginx_admin = f"{test_settings.nginx_dsn}/_test/admin"
+url_jwks = f"{test_settings.app_dsn}/.well-known/jwks.json"
+url_metrics = f"{test_settings.app_dsn}/metrics"
 
 user = {
     "email": fake.email(),
@@ -43,6 +61,15 @@ user = {
 
 login_data = {"email": user["email"], "password": user["password"]}
 
+login_statement_calls = r"""
+SELECT
+    coalesce(sum(calls) FILTER (WHERE query ~* '\m(users|tokens|sessions)\M'), 0)
+        AS statements,
+    coalesce(sum(calls) FILTER (WHERE query ILIKE 'COMMIT%'), 0) AS commits
+FROM pg_stat_statements
+WHERE query NOT ILIKE '%pg_stat_statements%'
+"""
+
 
 async def test_registration(session):
     async with session.post(url_signup, json=user) as response:
@@ -116,6 +143,23 @@ async def test_login(session):
         assert isinstance(body["refresh_token"], str)
 
 
+async def test_login_round_trips(session, engine):
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_stat_statements"))
+        connection.execute(text("SELECT pg_stat_statements_reset()"))
+
+        async with session.post(url_login, json=login_data) as response:
+
+            assert response.status == http.HTTPStatus.OK
+
+        calls = connection.execute(text(login_statement_calls)).one()
+
+    # The user with their roles, the token row, the session action.
+    assert calls.statements == 3
+    assert calls.commits == 1
+
+
 async def test_check_access_wo_user_role(session):
 
     async with session.post(url_login, json=login_data) as response:
@@ -217,3 +261,256 @@ async def test_logout(session):
     ) as response:
         await response.json()
         assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+
+async def test_jwks(session):
+    async with session.get(url_jwks) as response:
+        body = await response.json()
+
+        assert response.status == http.HTTPStatus.OK
+        assert isinstance(body["keys"], list)
+        assert "max-age" in response.headers["Cache-Control"]
+
+
+async def test_check_access_batch(session):
+
+    async with session.post(url_login, json=login_data) as response:
+
+        body = await response.json()
+        access_token = body["access_token"]
+
+    checks = {
+        "tokens": [
+            {"token": access_token},
+            {"token": access_token, "allow_roles": ["admin"]},
+            {"token": "not a token"},
+        ]
+    }
+    async with session.post(url_check_access_batch, json=checks) as response:
+        body = await response.json()
+
+        assert response.status == http.HTTPStatus.OK
+        assert [verdict["active"] for verdict in body] == [True, True, False]
+        assert [verdict["allowed"] for verdict in body] == [True, False, False]
+        assert body[0]["user"]["email"] == user["email"]
+
+
+async def test_authorize(session):
+
+    async with session.get(url_authorize) as response:
+        assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+    async with session.post(url_login, json=login_data) as response:
+
+        body = await response.json()
+        access_token = body["access_token"]
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    async with session.get(url_authorize, headers=headers) as response:
+
+        assert response.status == http.HTTPStatus.OK
+        assert response.headers["X-User-Id"]
+        assert "max-age" in response.headers["Cache-Control"]
+
+    async with session.get(
+        url_authorize, headers={**headers, "X-Allow-Roles": "admin"}
+    ) as response:
+
+        assert response.status == http.HTTPStatus.FORBIDDEN
+
+
+async def test_nginx_auth_request(session):
+
+    async with session.get(url_nginx_any) as response:
+        assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+    async with session.post(url_login, json=login_data) as response:
+
+        body = await response.json()
+        access_token = body["access_token"]
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    async with session.get(url_nginx_any, headers=headers) as response:
+        assert response.status == http.HTTPStatus.OK
+
+    # The allowed answer above is cached, but not for a location with roles.
+    async with session.get(url_nginx_admin, headers=headers) as response:
+        assert response.status == http.HTTPStatus.FORBIDDEN
+
+
+async def test_logout_all(session):
+
+    tokens = []
+    for _ in range(2):
+        async with session.post(url_login, json=login_data) as response:
+            tokens.append(await response.json())
+
+    async with session.post(
+        url_logout_all,
+        headers={"Authorization": f"Bearer {tokens[0]['access_token']}"},
+    ) as response:
+
+        assert response.status == http.HTTPStatus.OK
+
+    for pair in tokens:
+        async with session.get(
+            url_check_access,
+            headers={"Authorization": f"Bearer {pair['access_token']}"},
+        ) as response:
+
+            assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+        async with session.post(
+            url_refresh_token, json={"refresh_token": pair["refresh_token"]}
+        ) as response:
+
+            assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+
+async def test_login_throttled(session):
+
+    attempt = {"email": fake.email(), "password": fake.password()}
+    for _ in range(5):
+        async with session.post(url_login, json=attempt) as response:
+            assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+    async with session.post(url_login, json=attempt) as response:
+
+        assert response.status == http.HTTPStatus.TOO_MANY_REQUESTS
+        assert int(response.headers["Retry-After"]) > 0
+
+    async with session.get(url_metrics) as response:
+        body = await response.text()
+
+        assert 'auth_login_attempts_throttled_total{scope="email"}' in body
+
+
+async def test_concurrent_signup(session):
+    async def signup(new_user):
+        async with session.post(url_signup, json=new_user) as response:
+            return response.status, await response.json()
+
+    email = fake.email()
+    same_email = [
+        {**user, "email": email, "username": f"{fake.user_name()}{i}"}
+        for i in range(20)
+    ]
+    results = await asyncio.gather(*map(signup, same_email))
+
+    statuses = [status for status, _ in results]
+    assert statuses.count(http.HTTPStatus.OK) == 1
+    assert statuses.count(http.HTTPStatus.BAD_REQUEST) == 19
+    assert all(
+        body["detail"] == "The email is already in use"
+        for status, body in results
+        if status == http.HTTPStatus.BAD_REQUEST
+    )
+
+    distinct = [
+        {**user, "email": f"{i}{fake.email()}", "username": f"{fake.user_name()}{i}"}
+        for i in range(50)
+    ]
+    started = time.perf_counter()
+    results = await asyncio.gather(*map(signup, distinct))
+    elapsed = time.perf_counter() - started
+
+    assert all(status == http.HTTPStatus.OK for status, _ in results)
+    assert len({body["id"] for _, body in results}) == 50
+    # Hashing dominates; serialized signups would take far longer.
+    assert elapsed < 30, f"{len(distinct) / elapsed:.1f} signups/s"
+
+
+async def test_concurrent_refresh(session):
+
+    async with session.post(url_login, json=login_data) as response:
+        refresh_token = (await response.json())["refresh_token"]
+
+    async def refresh():
+        async with session.post(
+            url_refresh_token, json={"refresh_token": refresh_token}
+        ) as response:
+            return response.status
+
+    statuses = await asyncio.gather(*(refresh() for _ in range(10)))
+
+    assert statuses.count(http.HTTPStatus.OK) == 1
+    assert statuses.count(http.HTTPStatus.UNAUTHORIZED) == 9
+    assert await refresh() == http.HTTPStatus.UNAUTHORIZED
+
+
+async def test_tokens_partitioned(session, engine):
+
+    async with session.post(url_login, json=login_data) as response:
+        refresh_token = (await response.json())["refresh_token"]
+
+    async with session.post(
+        url_refresh_token, json={"refresh_token": refresh_token}
+    ) as response:
+        assert response.status == http.HTTPStatus.OK
+
+    with engine.connect() as connection:
+        partitions = connection.execute(
+            text(
+                "SELECT tableoid::regclass::text FROM tokens "
+                "ORDER BY created_at DESC LIMIT 2"
+            )
+        ).scalars()
+
+        # Both pairs land in the daily partition of today.
+        assert set(partitions) == {f"tokens_{time.strftime('%Y%m%d')}"}
+
+
+async def test_pool_metrics(session):
+
+    async with session.post(url_login, json=login_data) as response:
+        assert response.status == http.HTTPStatus.OK
+
+    async with session.get(url_metrics) as response:
+        body = await response.text()
+
+        assert "auth_db_pool_checked_out" in body
+        assert "auth_db_pool_wait_seconds_count" in body
+
+
+def stored_hash(engine, email: str) -> str:
+    with engine.connect() as connection:
+        return connection.execute(
+            text("SELECT hashed_password FROM users WHERE email = :email"),
+            {"email": email},
+        ).scalar_one()
+
+
+async def test_login_rehashes_password(session, engine):
+
+    # A user signed up now has a hash made with the current policy.
+    current = {
+        "email": fake.email(),
+        "password": fake.password(),
+        "full_name": fake.name(),
+        "username": fake.simple_profile()["username"],
+    }
+    async with session.post(url_signup, json=current) as response:
+        assert response.status == http.HTTPStatus.OK
+    method = stored_hash(engine, current["email"]).partition("$")[0]
+
+    old = {"email": fake.email(), "password": fake.password()}
+    old_hash = generate_password_hash(old["password"], "pbkdf2:sha256:1000")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO users (id, email, hashed_password, created_at) "
+                "VALUES (:id, :email, :hashed_password, now())"
+            ),
+            {"id": uuid4(), "email": old["email"], "hashed_password": old_hash},
+        )
+
+    async with session.post(url_login, json=old) as response:
+        assert response.status == http.HTTPStatus.OK
+
+    rehashed = stored_hash(engine, old["email"])
+    assert rehashed != old_hash
+    assert rehashed.partition("$")[0] == method
+
+    # The new hash still verifies.
+    async with session.post(url_login, json=old) as response:
+        assert response.status == http.HTTPStatus.OK
@@ -0,0 +1,74 @@
+import http
+
+import pytest
+from faker import Faker
+
+from tests.functional.settings import test_settings
+
+pytestmark = pytest.mark.asyncio
+
+fake = Faker()
+
+url_signup = f"{test_settings.app_dsn}/api/v1/auth/signup"
+
+user = {
+    "email": fake.email(),
+    "password": fake.password(),
+    "full_name": fake.name(),
+    "username": fake.simple_profile()["username"],
+}
+
+# A session that has written in its transaction reads while another
+# session's lookup of the same key is in flight: it has to see its write
+# instead of joining the lookup, which runs in another snapshot.
+FIRST_SHARED_AFTER_WRITE = """
+import asyncio
+
+from db.pg import async_session, engine
+from models.role import Role, UserRole
+from models.session import Session
+from models.token import Token
+from models.user import User
+from services.database import PostgresqlEngine
+from sqlalchemy import select, text, update
+
+
+async def main():
+    async with async_session() as reader, async_session() as writer:
+        query = select(User.id).where(User.email == {email!r})
+        user_id = (await reader.execute(query)).scalar_one()
+        await reader.commit()
+
+        key = ("test", user_id)
+        slow = select(User).where(
+            User.id == user_id, text("(SELECT count(*) FROM pg_sleep(1)) = 1")
+        )
+        in_flight = asyncio.create_task(
+            PostgresqlEngine(reader).first_shared(key, slow)
+        )
+        await asyncio.sleep(0.2)
+
+        await writer.execute(
+            update(User).where(User.id == user_id).values(full_name="written")
+        )
+        found = await PostgresqlEngine(writer).first_shared(
+            key, select(User).where(User.id == user_id)
+        )
+        await in_flight
+        await writer.rollback()
+        print(found.full_name)
+    await engine.dispose()
+
+
+asyncio.run(main())
+"""
+
+
+async def test_first_shared_after_write(session, app_container):
+
+    async with session.post(url_signup, json=user) as response:
+        assert response.status == http.HTTPStatus.OK
+
+    output = app_container.python(FIRST_SHARED_AFTER_WRITE.format(email=user["email"]))
+
+    assert output.strip().splitlines()[-1] == "written"
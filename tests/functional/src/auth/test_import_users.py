@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+from uuid import uuid4
+
+import pytest
+from faker import Faker
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+pytestmark = pytest.mark.asyncio
+
+fake = Faker()
+
+role = f"importer_{uuid4().hex[:8]}"
+other_role = f"importer_{uuid4().hex[:8]}"
+
+
+def new_user(roles: list[str]) -> dict:
+    return {
+        "email": fake.unique.email(),
+        "username": fake.unique.user_name(),
+        "full_name": fake.name(),
+        "password": fake.password(),
+        "roles": roles,
+    }
+
+
+csv_users = [new_user([role, other_role]), new_user([role]), new_user([])]
+ndjson_users = [new_user([other_role]), new_user([role, other_role])]
+# Hashes given in the file are stored as they are.
+ndjson_users[1]["hashed_password"] = generate_password_hash(
+    ndjson_users[1].pop("password")
+)
+
+
+def to_csv(users: list[dict]) -> str:
+    lines = io.StringIO()
+    writer = csv.DictWriter(
+        lines, fieldnames=["email", "username", "full_name", "password", "roles"]
+    )
+    writer.writeheader()
+    for user in users:
+        writer.writerow({**user, "roles": ";".join(user["roles"])})
+    return lines.getvalue()
+
+
+def to_ndjson(users: list[dict]) -> str:
+    return "".join(json.dumps(user) + "\n" for user in users)
+
+
+def import_users(app_container, path: str) -> str:
+    return app_container.run(
+        "python",
+        "cli/manage.py",
+        "import-users",
+        path,
+        "--batch-size",
+        "2",
+        "--workers",
+        "1",
+    )
+
+
+def imported(engine, users: list[dict]) -> dict[str, list[str]]:
+    """
+    Role names of every imported user row, by email; a duplicate user
+    would show up twice.
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                """
+                SELECT users.email, array_remove(array_agg(roles.name), NULL)
+                FROM users
+                LEFT JOIN user_roles ON user_roles.user_id = users.id
+                LEFT JOIN roles ON roles.id = user_roles.role_id
+                WHERE users.email = ANY(:emails)
+                GROUP BY users.id, users.email
+                """
+            ),
+            {"emails": [user["email"] for user in users]},
+        ).all()
+    found = {}
+    for email, names in rows:
+        assert email not in found, f"{email} is imported twice"
+        found[email] = sorted(names)
+    return found
+
+
+@pytest.mark.parametrize(
+    "name, users, serialize",
+    [("users.csv", csv_users, to_csv), ("users.ndjson", ndjson_users, to_ndjson)],
+)
+async def test_import_users(app_container, engine, name, users, serialize):
+
+    path = f"/tmp/{uuid4().hex}_{name}"
+    app_container.put_file(path, serialize(users))
+
+    output = import_users(app_container, path)
+    assert f"Done: {len(users)} users imported" in output
+
+    # An interrupted run resumes after its last recorded batch; batches
+    # loaded after it are loaded again and skipped.
+    app_container.put_file(f"{path}.imported", "1")
+    output = import_users(app_container, path)
+    assert "Resuming after 1 rows" in output
+    assert "Done: 0 users imported" in output
+
+    expected = {user["email"]: sorted(user["roles"]) for user in users}
+    assert imported(engine, users) == expected
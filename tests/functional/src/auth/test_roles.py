@@ -1,4 +1,5 @@
 import http
+import json
 
 import pytest
 from faker import Faker
@@ -11,6 +12,7 @@ from tests.models.role import Role, UserRole
 from tests.models.session import Session
 from tests.models.token import Token
 from tests.models.user import User
+from werkzeug.security import generate_password_hash
 
 fake = Faker()
 
@@ -44,7 +46,7 @@ async def test_get_all_roles_wo_creds(session, get_db):
 
     user = User(
         email=admin_user["email"],
-        password=admin_user["password"],
+        hashed_password=generate_password_hash(admin_user["password"]),
         username=admin_user["username"],
         full_name=admin_user["full_name"],
     )
@@ -75,3 +77,74 @@ async def test_get_all_roles_not_admin(session):
         await response.json()
 
     assert response.status == http.HTTPStatus.UNAUTHORIZED
+
+
+# Role checks of AuthService against the registry loaded from the roles
+# table: a token with a role mask, a token issued before role masks that
+# carries role names, and a mask whose role got a new bit.
+ROLE_CHECKS = """
+import asyncio
+import json
+
+from db.pg import async_session, engine
+from models.role import Role
+from services.auth import AuthService
+from services.database import BaseDb, PostgresqlEngine
+from services.role_registry import role_registry
+from sqlalchemy import delete, insert, select
+
+NAME = {name!r}
+
+
+async def create_role(db):
+    await db.execute(insert(Role).values(name=NAME))
+    bit = (await db.execute(select(Role.bit).where(Role.name == NAME))).scalar_one()
+    await db.commit()
+    await role_registry.refresh(db)
+    return bit
+
+
+async def main():
+    checks = {{}}
+    async with async_session() as session:
+        db = BaseDb(PostgresqlEngine(session))
+        bit = await create_role(db)
+        checks["mask"] = AuthService.has_roles({{"role_mask": 1 << bit}}, [NAME])
+        checks["other_mask"] = AuthService.has_roles(
+            {{"role_mask": 1 << bit + 1}}, [NAME]
+        )
+        checks["legacy"] = AuthService.has_roles({{"roles": [NAME]}}, [NAME])
+        checks["legacy_other"] = AuthService.has_roles({{"roles": ["other"]}}, [NAME])
+
+        # A role created again under the same name gets a new bit.
+        await db.execute(delete(Role).where(Role.name == NAME))
+        new_bit = await create_role(db)
+        checks["new_bit"] = new_bit != bit
+        checks["old_mask"] = AuthService.has_roles({{"role_mask": 1 << bit}}, [NAME])
+        checks["new_mask"] = AuthService.has_roles(
+            {{"role_mask": 1 << new_bit}}, [NAME]
+        )
+
+        await db.execute(delete(Role).where(Role.name == NAME))
+        await db.commit()
+    await engine.dispose()
+    print(json.dumps(checks))
+
+
+asyncio.run(main())
+"""
+
+
+async def test_role_checks(app_container):
+
+    output = app_container.python(ROLE_CHECKS.format(name=f"role_{fake.uuid4()}"))
+
+    assert json.loads(output.strip().splitlines()[-1]) == {
+        "mask": True,
+        "other_mask": False,
+        "legacy": True,
+        "legacy_other": False,
+        "new_bit": True,
+        "old_mask": False,
+        "new_mask": True,
+    }
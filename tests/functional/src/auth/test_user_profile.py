@@ -87,18 +87,25 @@ async def test_update_user_profile(session):
         body = await response.json()
     assert response.status == http.HTTPStatus.OK
 
+    # The password change revokes the tokens issued before it.
     async with session.get(
         url_users, headers={"Authorization": f"Bearer {access_token}"}
     ) as response:
-        body = await response.json()
-
-    assert body["username"] == new_username
+        assert response.status == http.HTTPStatus.UNAUTHORIZED
 
     login_data["password"] = new_passord
-    # async with session.post(url_login, json=login_data) as response:
+    async with session.post(url_login, json=login_data) as response:
+
+        body = await response.json()
+
+        assert response.status == http.HTTPStatus.OK
+        assert isinstance(body["access_token"], str)
+        assert isinstance(body["refresh_token"], str)
+        access_token = body["access_token"]
 
-    #     body = await response.json()
+    async with session.get(
+        url_users, headers={"Authorization": f"Bearer {access_token}"}
+    ) as response:
+        body = await response.json()
 
-    #     assert response.status == http.HTTPStatus.OK
-    #     assert isinstance(body["access_token"], str)
-    #     assert isinstance(body["refresh_token"], str)
+    assert body["username"] == new_username